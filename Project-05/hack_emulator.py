@@ -0,0 +1,461 @@
+# Hack machine emulator (the CPU of Project 5 plus ROM/RAM/screen/keyboard)
+#
+# Every C-instruction word in ROM is decoded once into a small Python
+# function specialised for its comp/dest/jump fields; the run loop is then
+# a single table lookup and call per instruction. A-instructions stay plain
+# ints in the table.
+#
+# With blocks=True, the code starting at each address control reaches is,
+# once entered HOT times, compiled into one Python function: a basic block
+# extended along fall-throughs and constant jumps, with A, D and pc kept in
+# locals and constant A addresses folded in. Cold code and the tail of an
+# exact cycle limit still go through the per-instruction interpreter.
+#
+# With natives installed, reaching the (Class.function) label of a Math,
+# Memory or String function runs its Python version from
+# Project-12/os_natives.py and returns to the caller as the VM `return`
+# would, in one cycle.
+
+import argparse
+import os
+import sys
+import time
+from array import array
+
+RAM_SIZE = 32768  # 15-bit addresses: ram[A] with A < 0 wraps like A & 0x7FFF
+ROM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+
+# the Hack assembler lives with Project 6, the native OS with Project 12
+ASSEMBLER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Project-06")
+NATIVES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Project-12")
+SP, LCL, ARG, THIS, THAT = range(5)
+
+# zx nx zy ny f no -> expression over x (D) and y (A or M)
+COMP = {
+    0b101010: "0", 0b111111: "1", 0b111010: "-1",
+    0b001100: "x", 0b110000: "y",
+    0b001101: "~x", 0b110001: "~y",
+    0b001111: "-x", 0b110011: "-y",
+    0b011111: "x + 1", 0b110111: "y + 1",
+    0b001110: "x - 1", 0b110010: "y - 1",
+    0b000010: "x + y", 0b010011: "x - y", 0b000111: "y - x",
+    0b000000: "x & y", 0b010101: "x | y",
+}
+JUMP = {1: "v > 0", 2: "v == 0", 3: "v >= 0", 4: "v < 0", 5: "v != 0", 6: "v <= 0"}
+
+STOP = object()  # marks halt loops, the end of ROM and run(until_pc=...)
+MAX_BLOCK = 256  # instructions compiled into one block
+HOT = 8  # entries into an address before its block is compiled
+
+
+def to_signed(word):
+    return word - 0x10000 if word & 0x8000 else word
+
+
+def alu(x, y, bits):
+    # the full ALU, for comp codes outside the documented table
+    if bits & 0b100000: x = 0
+    if bits & 0b010000: x = ~x
+    if bits & 0b001000: y = 0
+    if bits & 0b000100: y = ~y
+    out = x + y if bits & 0b000010 else x & y
+    if bits & 0b000001: out = ~out
+    return (out + 32768 & 0xFFFF) - 32768
+
+
+def comp_expr(word, a="A"):
+    # Python expression for the comp field, with A read as `a`
+    y = f"ram[{a}]" if word & 0x1000 else a
+    bits = (word >> 6) & 0x3F
+
+    expr = COMP.get(bits)
+    if expr is None:
+        return f"alu(D, {y}, {bits})"
+    expr = expr.replace("x", "D").replace("y", y)
+    if expr != "-1" and ("+" in expr or "-" in expr):
+        expr = f"({expr} + 32768 & 0xFFFF) - 32768"
+    return expr
+
+
+def c_source(word):
+    # Python source of the handler for one C-instruction:
+    # op(A, D, pc) -> (A, D, next pc)
+    dest = (word >> 3) & 7
+    jump = word & 7
+
+    lines = ["def op(A, D, pc):", f"    v = {comp_expr(word)}"]
+    if jump and dest & 4:
+        lines.append("    target = A")  # jumps go to the A value before the write
+    if dest & 1:
+        lines.append("    ram[A] = v")
+    if dest & 2:
+        lines.append("    D = v")
+    if dest & 4:
+        lines.append("    A = v")
+
+    target = "target" if dest & 4 else "A"
+    if jump == 7:
+        lines.append(f"    return A, D, {target}")
+    elif jump:
+        lines.append(f"    return A, D, {target} if {JUMP[jump]} else pc + 1")
+    else:
+        lines.append("    return A, D, pc + 1")
+    return "\n".join(lines)
+
+
+def block_source(rom, start, stops):
+    # Python source of block(A, D, budget) -> (A, D, next pc, cycles) for the
+    # code from start on, and the most instructions one pass through it runs.
+    #
+    # The block follows fall-throughs and jumps to constant addresses and
+    # leaves through a return at every other exit; a jump back to start
+    # becomes a loop, taken while the budget allows another full pass.
+    # `a` is A's value while it is a known constant (the local A is then
+    # stale), or "A" once it was computed.
+    body = []
+    a = "A"
+    pc = start
+    k = 0  # instructions so far on this path
+    visited = set()
+
+    def loop_back(indent, k):
+        pad = " " * indent
+        if a != "A":
+            body.append(f"{pad}A = {a}")
+        body.append(f"{pad}n += {k}")
+        body.append(f"{pad}if n + LENGTH > budget: return A, D, {start}, n")
+        body.append(f"{pad}continue")
+
+    while True:
+        if k and (pc in visited or pc in stops or k >= MAX_BLOCK or not 0 <= pc < len(rom)):
+            if pc == start and start not in stops:
+                loop_back(8, k)
+            else:
+                body.append(f"        return {a}, D, {pc}, n + {k}")
+            break
+
+        visited.add(pc)
+        word = rom[pc]
+        k += 1
+        if word >= 0:
+            a = str(word)
+            pc += 1
+            continue
+
+        dest = (word >> 3) & 7
+        jump = word & 7
+        expr = comp_expr(word, a)
+        if jump:
+            body.append(f"        v = {expr}")
+            expr = "v"
+        target = a
+
+        targets = []
+        if dest & 1:
+            targets.append(f"ram[{a}]")
+        if dest & 2:
+            targets.append("D")
+        if dest & 4:
+            targets.append("A")
+            a = "A"
+        if targets:
+            if jump and target == "A" and dest & 4:
+                body.append("        t = A")
+                target = "t"
+            body.append(f"        {' = '.join(targets)} = {expr}")
+
+        if jump == 7:
+            if not target.isdigit():
+                body.append(f"        return {a}, D, {target}, n + {k}")
+                break
+            pc = int(target)
+        elif jump:
+            body.append(f"        if {JUMP[jump]}:")
+            if target == str(start) and start not in stops:
+                loop_back(12, k)
+            else:
+                body.append(f"            return {a}, D, {target}, n + {k}")
+            pc += 1
+        else:
+            pc += 1
+
+    length = len(visited)
+    lines = ["def block(A, D, budget):", "    n = 0", "    while True:"]
+    lines += [line.replace("LENGTH", str(length)) for line in body]
+    return "\n".join(lines), length
+
+
+class HackMachine:
+    def __init__(self, words, blocks=False):
+        self.rom = array("h", (to_signed(w & 0xFFFF) for w in words))
+        if len(self.rom) > ROM_SIZE:
+            raise ValueError(f"program of {len(self.rom)} words does not fit in ROM")
+        self.ram = array("h", bytes(2 * RAM_SIZE))
+        self.handlers = {}
+        self.ops = self.decode()
+        self.halts = {pc for pc in range(len(self.rom) - 1)
+                      if self.rom[pc] == pc and self.rom[pc + 1] == to_signed(0b1110101010000111)}
+        for pc in self.halts:
+            self.ops[pc] = STOP
+
+        # compiled blocks, indexed by start pc; no block runs into a stop
+        self.use_blocks = blocks
+        self.stops = self.halts | {len(self.rom)}
+        self.blocks = {}
+        self.entries = {}
+        self.natives = None
+        self.native_ops = {}  # pc -> handler of a native OS function
+        self.reset()
+
+    def reset(self):
+        self.A = self.D = self.pc = 0
+        self.cycles = 0
+
+    # -------------------------------------------------
+    # Decode
+    # -------------------------------------------------
+    def handler(self, word):
+        op = self.handlers.get(word)
+        if op is None:
+            scope = {"ram": self.ram, "alu": alu}
+            exec(c_source(word), scope)
+            op = self.handlers[word] = scope["op"]
+        return op
+
+    def decode(self):
+        # pc -> int (A-instruction) or handler; STOP past the last word
+        ops = [word if word >= 0 else self.handler(word) for word in self.rom]
+        ops.append(STOP)
+        return ops
+
+    # -------------------------------------------------
+    # Compiled blocks
+    # -------------------------------------------------
+    def compile_block(self, start):
+        # (function, longest pass) for the code starting at start
+        op = self.native_ops.get(start)
+        if op is not None:
+            def native(A, D, budget):
+                return (*op(A, D, start), 1)
+            block = self.blocks[start] = (native, 1)
+            return block
+
+        source, length = block_source(self.rom, start, self.stops)
+        scope = {"ram": self.ram, "alu": alu}
+        exec(source, scope)
+        block = self.blocks[start] = (scope["block"], length)
+        return block
+
+    def run_blocks(self, until_pc, limit):
+        if until_pc is not None and until_pc not in self.stops:
+            # no block may run past a stop address
+            self.stops.add(until_pc)
+            self.blocks.clear()
+
+        ops, blocks, entries, stops = self.ops, self.blocks, self.entries, self.stops
+        A, D, pc, cycles = self.A, self.D, self.pc, self.cycles
+        while pc != until_pc and ops[pc] is not STOP:
+            block = blocks.get(pc)
+            if block is None:
+                count = entries[pc] = entries.get(pc, 0) + 1
+                if count < HOT:
+                    # cold code: interpret up to the next jump
+                    while cycles < limit:
+                        op = ops[pc]
+                        if op.__class__ is int:
+                            A = op
+                            pc += 1
+                        else:
+                            last = pc
+                            A, D, pc = op(A, D, pc)
+                            cycles += 1
+                            if pc != last + 1 or pc in stops:
+                                break
+                            continue
+                        cycles += 1
+                        if pc in stops:
+                            break
+                    else:
+                        break
+                    continue
+                block = self.compile_block(pc)
+            run, length = block
+            if cycles + length > limit:
+                break
+            A, D, pc, n = run(A, D, limit - cycles)
+            cycles += n
+
+        self.A, self.D, self.pc, self.cycles = A, D, pc, cycles
+
+    # -------------------------------------------------
+    # Natives
+    # -------------------------------------------------
+    def install_natives(self, labels, classes=None):
+        # hooks the enabled natives at their function labels; -> NativeOS
+        sys.path.insert(0, NATIVES_DIR)
+        from os_natives import NativeOS
+
+        self.natives = NativeOS(self.ram, classes)
+        for name in self.natives.functions():
+            address = labels.get(name)
+            if address is not None:
+                op = self.ops[address] = self.native_op(*self.natives.hook(name))
+                self.native_ops[address] = op
+                self.stops.add(address)
+        self.blocks.clear()
+        return self.natives
+
+    def native_op(self, nargs, call):
+        # at (F): the caller's frame is on the stack and LCL = SP
+        ram = self.ram
+
+        def op(A, D, pc):
+            frame, arg = ram[LCL], ram[ARG]
+            # read before the result lands: without arguments, ARG is LCL-5
+            ret = ram[frame - 5]
+            ram[arg] = call(*ram[arg:arg + nargs])
+            ram[SP] = arg + 1
+            ram[LCL:THAT + 1] = ram[frame - 4:frame]
+            return A, D, ret
+        return op
+
+    # -------------------------------------------------
+    # Run
+    # -------------------------------------------------
+    def run(self, until_pc=None, max_cycles=None):
+        # Runs until pc == until_pc, max_cycles instructions have executed, a
+        # halt loop ((L) @L 0;JMP) is reached or pc leaves the program.
+        # Returns "pc", "cycles", "halt" or "end".
+        limit = self.cycles + max_cycles if max_cycles is not None else float("inf")
+        if self.use_blocks:
+            # the interpreter below finishes the last partial block
+            self.run_blocks(until_pc, limit)
+
+        ops = self.ops
+        saved = None
+        if until_pc is not None:
+            saved, ops[until_pc] = ops[until_pc], STOP
+
+        A, D, pc = self.A, self.D, self.pc
+        cycles = self.cycles
+        try:
+            while cycles < limit:
+                op = ops[pc]
+                if op.__class__ is int:
+                    A = op
+                    pc += 1
+                elif op is STOP:
+                    break
+                else:
+                    A, D, pc = op(A, D, pc)
+                cycles += 1
+        finally:
+            if until_pc is not None:
+                ops[until_pc] = saved
+            self.A, self.D, self.pc, self.cycles = A, D, pc, cycles
+
+        if pc == until_pc:
+            return "pc"
+        if pc in self.halts:
+            return "halt"
+        if pc >= len(self.rom):
+            return "end"
+        return "cycles"
+
+    def step(self):
+        return self.run(max_cycles=1)
+
+
+# -------------------------------------------------
+# Loading
+# -------------------------------------------------
+def load_program(path):
+    # (ROM words, labels or None) from .hack, .bin or .asm
+    if path.endswith(".hack"):
+        with open(path) as f:
+            return [int(line, 2) for line in f.read().split()], None
+
+    if path.endswith(".bin"):
+        words = array("H")
+        with open(path, "rb") as f:
+            words.frombytes(f.read())
+        if sys.byteorder == "little":
+            words.byteswap()
+        return list(words), None
+
+    sys.path.insert(0, ASSEMBLER_DIR)
+    from hack_assembler import Assembler
+
+    with open(path) as f:
+        assembler = Assembler()
+        words = assembler.assemble(f.read().split("\n"))
+    return list(words), assembler.labels
+
+
+# -------------------------------------------------
+# Entry
+# -------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a Hack program")
+    parser.add_argument("file", help="Xxx.hack, Xxx.bin or Xxx.asm")
+    parser.add_argument("--cycles", type=int, default=10_000_000,
+                        help="stop after this many instructions")
+    parser.add_argument("--until", metavar="PC",
+                        help="stop when pc reaches this address (or label, for .asm)")
+    parser.add_argument("--ram", nargs=2, type=int, action="append", default=[],
+                        metavar=("ADDR", "VALUE"), help="preset RAM[ADDR] = VALUE")
+    parser.add_argument("--dump", default="0-15", metavar="FROM-TO",
+                        help="RAM range printed at the end")
+    parser.add_argument("--blocks", action="store_true",
+                        help="compile hot code into one Python function per block")
+    parser.add_argument("--bench", action="store_true",
+                        help="run with and without --blocks and compare speeds")
+    sys.path.insert(0, NATIVES_DIR)
+    from os_natives import CLASSES as NATIVE_CLASSES, NativeError
+
+    parser.add_argument("--natives", nargs="?", const=",".join(NATIVE_CLASSES), metavar="CLASSES",
+                        help="run OS functions natively, for .asm programs that contain them "
+                             "(comma-separated classes, default all: " + ", ".join(NATIVE_CLASSES) + ")")
+    args = parser.parse_args()
+
+    words, labels = load_program(args.file)
+    if args.natives and labels is None:
+        parser.error("--natives needs an .asm program")
+
+    until = None
+    if args.until is not None:
+        if args.until.isdigit():
+            until = int(args.until)
+        elif labels is None:
+            parser.error("--until LABEL needs an .asm program")
+        else:
+            until = labels[args.until]
+
+    modes = [False, True] if args.bench else [args.blocks]
+    for blocks in modes:
+        machine = HackMachine(words, blocks=blocks)
+        for address, value in args.ram:
+            machine.ram[address] = value
+        if args.natives:
+            try:
+                machine.install_natives(labels, args.natives.split(","))
+            except NativeError as e:
+                parser.error(str(e))
+
+        start = time.perf_counter()
+        try:
+            reason = machine.run(until_pc=until, max_cycles=args.cycles)
+        except NativeError as e:
+            sys.exit(f"error: {e}")
+        seconds = time.perf_counter() - start
+
+        mode = "blocks" if blocks else "interpreter"
+        print(f"{mode}: stopped ({reason}) at pc={machine.pc} after {machine.cycles} cycles "
+              f"in {seconds:.2f}s ({machine.cycles / seconds / 1e6:.2f}M instructions/s)")
+    lo, hi = map(int, args.dump.split("-"))
+    for address in range(lo, hi + 1):
+        print(f"RAM[{address}] = {machine.ram[address]}")
+    if machine.natives:
+        print(machine.natives.report())
@@ -0,0 +1,302 @@
+# Cycle profiler for translated VM programs running on the Hack emulator
+#
+# The Project 8 translator leaves a (Class.function) label at every function
+# and a File$RET$n label after every call. From those the profiler maps
+# emulated cycles back to VM functions:
+#
+#   exact     every instruction runs through a copy of the interpreter loop
+#             that pushes a frame when pc reaches a function label and pops
+#             one at a call's return label; cycles spent in the shared
+#             runtime routines count for the function that jumped there.
+#             A tail call (--tail-calls) has no return label: the function
+#             it jumps to replaces the caller's frame
+#   sampling  the program runs in compiled blocks and every N cycles the
+#             call stack is read back from the frames in RAM (return
+#             address at LCL-5, caller's LCL at LCL-4); samples taken in a
+#             runtime routine (VM$CALL, VM$EQ, ...) show it as a leaf
+#
+# Both report exclusive and inclusive cycles, calls (exact only) and the
+# call graph as flat text, and can write collapsed stacks
+# ("Sys.init;Main.main;Math.multiply 1234" lines) for flamegraph tools.
+
+import argparse
+import time
+from bisect import bisect_right
+from collections import Counter, defaultdict
+
+from hack_emulator import HackMachine, STOP, LCL, SP, load_program, to_signed
+
+BOOTSTRAP = "(bootstrap)"
+RUNTIME_PREFIX = "VM$"
+# runtime routines called with the return address in D (compares, intrinsics)
+LINKED_ROUTINES = {"VM$EQ", "VM$GT", "VM$LT", "VM$MULTIPLY", "VM$DIVIDE"}
+MAX_DEPTH = 1000  # frames followed when reading a stack back from RAM
+
+# event kinds per ROM address
+ENTRY, RETURN_SITE, TAIL_JUMP = 1, 2, 3
+
+# the translator's tail call ends in SP = LCL, goto f (@LCL D=M @SP M=D @f 0;JMP)
+TAIL_JUMP_CODE = [LCL, to_signed(0b1111110000010000), SP, to_signed(0b1110001100001000)]
+JUMP = to_signed(0b1110101010000111)
+
+
+class ProgramMap:
+    def __init__(self, rom, labels):
+        # function and runtime routine entry points, in ROM order
+        starts = {}
+        for name, address in labels.items():
+            if ("." in name and "$" not in name) or (
+                    name.startswith(RUNTIME_PREFIX) and name.count("$") == 1):
+                starts.setdefault(address, name)
+        starts.setdefault(0, BOOTSTRAP)
+        self.addresses = sorted(starts)
+        self.names = [starts[a] for a in self.addresses]
+        self.functions = {address: name for name, address in labels.items()
+                          if "." in name and "$" not in name}
+
+        # call return sites, i.e. File$RET$n labels that a linked routine
+        # does not return to (the word before them is `@routine 0;JMP`)
+        linked = {labels[name] for name in LINKED_ROUTINES if name in labels}
+        self.return_sites = set()
+        for name, address in labels.items():
+            if "$RET$" in name and not (address >= 2 and rom[address - 2] in linked):
+                self.return_sites.add(address)
+
+        # the 0;JMP words of tail calls
+        self.tail_jumps = {pc for pc in range(5, len(rom))
+                           if rom[pc] == JUMP and rom[pc - 1] in self.functions
+                           and list(rom[pc - 5:pc - 1]) == TAIL_JUMP_CODE}
+
+    def owner(self, pc):
+        return self.names[bisect_right(self.addresses, pc) - 1]
+
+
+# -------------------------------------------------
+# Exact
+# -------------------------------------------------
+class ExactProfile:
+    def __init__(self):
+        self.exclusive = Counter()
+        self.inclusive = Counter()
+        self.calls = Counter()
+        self.edges = defaultdict(lambda: [0, 0])  # (caller, callee) -> [calls, cycles]
+        self.stacks = Counter()                  # collapsed stack -> cycles
+
+
+def profile_exact(machine, program, max_cycles=None):
+    # -> (ExactProfile, stop reason); machine.run() with attribution
+    prof = ExactProfile()
+    kinds = bytearray(len(machine.ops))
+    for address in program.return_sites:
+        kinds[address] = RETURN_SITE
+    for address in program.functions:
+        # the bootstrap's return label is also the first function's
+        kinds[address] = ENTRY
+    for address in program.tail_jumps:
+        kinds[address] = TAIL_JUMP
+
+    exclusive, inclusive, calls = prof.exclusive, prof.inclusive, prof.calls
+    edges, stacks = prof.edges, prof.stacks
+    owner, functions = program.owner, program.functions
+
+    # frames: (function, collapsed stack, cycles at entry); recursion is
+    # only charged once, by the outermost active frame of a function or
+    # caller -> callee edge
+    top = owner(machine.pc)
+    frames = [(top, top, machine.cycles)]
+    active = Counter({top: 1})
+    active_edges = Counter()
+    last = machine.cycles
+    tail = False  # at a tail call's jump, so the next entry replaces the frame
+
+    def leave(cycles):
+        callee, _, start = frames.pop()
+        edge = frames[-1][0], callee
+        active[callee] -= 1
+        active_edges[edge] -= 1
+        if not active[callee]:
+            inclusive[callee] += cycles - start
+        if not active_edges[edge]:
+            edges[edge][1] += cycles - start
+
+    ops = machine.ops
+    A, D, pc, cycles = machine.A, machine.D, machine.pc, machine.cycles
+    limit = cycles + max_cycles if max_cycles is not None else float("inf")
+    while cycles < limit:
+        op = ops[pc]
+        if op.__class__ is int:
+            A = op
+            pc += 1
+        elif op is STOP:
+            break
+        else:
+            A, D, pc = op(A, D, pc)
+        cycles += 1
+
+        kind = kinds[pc]
+        if not kind:
+            continue
+        name, stack, _ = frames[-1]
+        exclusive[name] += cycles - last
+        stacks[stack] += cycles - last
+        last = cycles
+
+        if kind == ENTRY:
+            callee = functions[pc]
+            calls[callee] += 1
+            edges[name, callee][0] += 1
+            if tail and len(frames) > 1:
+                # the callee returns to our caller, under which it is charged
+                leave(cycles)
+                name, stack, _ = frames[-1]
+            tail = False
+            active[callee] += 1
+            active_edges[name, callee] += 1
+            frames.append((callee, f"{stack};{callee}", cycles))
+        elif kind == TAIL_JUMP:
+            tail = True
+        elif len(frames) > 1:
+            leave(cycles)
+
+    machine.A, machine.D, machine.pc, machine.cycles = A, D, pc, cycles
+
+    # charge the frames still open
+    name, stack, _ = frames[-1]
+    exclusive[name] += cycles - last
+    stacks[stack] += cycles - last
+    while len(frames) > 1:
+        leave(cycles)
+    inclusive[top] += cycles - frames[0][2]
+
+    reason = "halt" if pc in machine.halts else "end" if pc >= len(machine.rom) else "cycles"
+    return prof, reason
+
+
+# -------------------------------------------------
+# Sampling
+# -------------------------------------------------
+def read_stack(machine, program):
+    # call stack, outermost first, from pc and the frames in RAM
+    ram = machine.ram
+    stack = [program.owner(machine.pc)]
+    lcl = ram[LCL]
+    while len(stack) < MAX_DEPTH and 5 <= lcl:
+        # the return label ends the call, so the caller owns the word before it
+        caller = program.owner((ram[lcl - 5] & 0x7FFF) - 1)
+        if caller == BOOTSTRAP or caller.startswith(RUNTIME_PREFIX):
+            break
+        stack.append(caller)
+        next_lcl = ram[lcl - 4]
+        if next_lcl >= lcl:
+            break
+        lcl = next_lcl
+    stack.reverse()
+    return stack
+
+
+def profile_sampled(machine, program, interval, max_cycles=None):
+    # -> (collapsed stack -> samples, stop reason)
+    samples = Counter()
+    limit = machine.cycles + max_cycles if max_cycles is not None else float("inf")
+    reason = "cycles"
+    while machine.cycles < limit:
+        reason = machine.run(max_cycles=min(interval, limit - machine.cycles))
+        samples[";".join(read_stack(machine, program))] += 1
+        if reason != "cycles":
+            break
+    return samples, reason
+
+
+def totals(stacks):
+    # (exclusive, inclusive, call graph edges) summed over collapsed stacks
+    exclusive, inclusive = Counter(), Counter()
+    edges = defaultdict(lambda: [0, 0])
+    for stack, count in stacks.items():
+        names = stack.split(";")
+        exclusive[names[-1]] += count
+        for name in set(names):
+            inclusive[name] += count
+        for pair in set(zip(names, names[1:])):
+            edges[pair][1] += count
+    return exclusive, inclusive, edges
+
+
+# -------------------------------------------------
+# Output
+# -------------------------------------------------
+def flat_report(exclusive, inclusive, calls, unit):
+    total = sum(exclusive.values()) or 1
+    lines = [f"{'self %':>7} {'self ' + unit:>14} {'total ' + unit:>14} {'calls':>9}  function"]
+    for name, count in exclusive.most_common():
+        lines.append(f"{100 * count / total:7.2f} {count:14} {inclusive[name]:14} "
+                     f"{calls.get(name, '-') if calls is not None else '-':>9}  {name}")
+    return "\n".join(lines)
+
+
+def graph_report(edges, unit):
+    callers, callees = defaultdict(list), defaultdict(list)
+    for (caller, callee), (count, cost) in edges.items():
+        callees[caller].append((cost, count, callee))
+        callers[callee].append((cost, count, caller))
+
+    lines = [f"call graph ({unit} spent in the callee under each caller)"]
+    for name in sorted(set(callers) | set(callees)):
+        lines.append(name)
+        for cost, count, caller in sorted(callers[name], reverse=True):
+            lines.append(f"    <- {caller:40} {count or '':>9} {cost:14}")
+        for cost, count, callee in sorted(callees[name], reverse=True):
+            lines.append(f"    -> {callee:40} {count or '':>9} {cost:14}")
+    return "\n".join(lines)
+
+
+def write_collapsed(path, stacks):
+    with open(path, "w") as f:
+        for stack, count in sorted(stacks.items()):
+            if count:
+                f.write(f"{stack} {count}\n")
+
+
+# -------------------------------------------------
+# Entry
+# -------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile a translated VM program by function")
+    parser.add_argument("file", help="Xxx.asm from the VM translator")
+    parser.add_argument("--cycles", type=int, default=100_000_000,
+                        help="stop after this many instructions")
+    parser.add_argument("--sample", type=int, metavar="N",
+                        help="sample the call stack every N cycles instead of counting exactly")
+    parser.add_argument("--collapsed", metavar="FILE",
+                        help="write collapsed stacks for flamegraph tools")
+    parser.add_argument("--graph", action="store_true", help="also print the call graph")
+    parser.add_argument("--natives", nargs="?", const="", metavar="CLASSES",
+                        help="run OS functions natively (see hack_emulator.py)")
+    args = parser.parse_args()
+
+    if not args.file.endswith(".asm"):
+        parser.error("the profiler needs the labels of an .asm program")
+    words, labels = load_program(args.file)
+    machine = HackMachine(words, blocks=args.sample is not None)
+    program = ProgramMap(machine.rom, labels)
+    if args.natives is not None:
+        machine.install_natives(labels, args.natives.split(",") if args.natives else None)
+
+    start = time.perf_counter()
+    if args.sample:
+        stacks, reason = profile_sampled(machine, program, args.sample, args.cycles)
+        exclusive, inclusive, edges = totals(stacks)
+        calls, unit = None, "samples"
+    else:
+        prof, reason = profile_exact(machine, program, args.cycles)
+        stacks, exclusive, inclusive = prof.stacks, prof.exclusive, prof.inclusive
+        edges, calls, unit = prof.edges, prof.calls, "cycles"
+    seconds = time.perf_counter() - start
+
+    print(f"stopped ({reason}) after {machine.cycles} cycles in {seconds:.2f}s")
+    print(flat_report(exclusive, inclusive, calls, unit))
+    if args.graph:
+        print()
+        print(graph_report(edges, unit))
+    if args.collapsed:
+        write_collapsed(args.collapsed, stacks)
+        print(f"✔ Wrote {args.collapsed}")
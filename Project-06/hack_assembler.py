@@ -0,0 +1,186 @@
+# Hack assembler: .asm -> .hack (text) and .bin (packed 16-bit ROM image)
+#
+# Can also be fed the VMTranslator.output list directly, so the translator
+# pipeline never has to write the assembly out and parse it again.
+
+import argparse
+import os
+import re
+import sys
+import time
+from array import array
+
+PREDEFINED = {
+    "SP": 0, "LCL": 1, "ARG": 2, "THIS": 3, "THAT": 4,
+    "SCREEN": 16384, "KBD": 24576,
+    **{f"R{i}": i for i in range(16)}
+}
+VARIABLE_BASE = 16
+MAX_ADDRESS = 0x7FFF  # A-instructions carry 15 bits
+
+# letters, digits, _ . $ : and no leading digit
+SYMBOL = re.compile(r"[A-Za-z_.$:][A-Za-z0-9_.$:]*")
+
+# a + c1..c6 bits of every computation
+COMP = {
+    "0": 0b0101010, "1": 0b0111111, "-1": 0b0111010,
+    "D": 0b0001100, "A": 0b0110000, "M": 0b1110000,
+    "!D": 0b0001101, "!A": 0b0110001, "!M": 0b1110001,
+    "-D": 0b0001111, "-A": 0b0110011, "-M": 0b1110011,
+    "D+1": 0b0011111, "A+1": 0b0110111, "M+1": 0b1110111,
+    "D-1": 0b0001110, "A-1": 0b0110010, "M-1": 0b1110010,
+    "D+A": 0b0000010, "D+M": 0b1000010,
+    "D-A": 0b0010011, "D-M": 0b1010011,
+    "A-D": 0b0000111, "M-D": 0b1000111,
+    "D&A": 0b0000000, "D&M": 0b1000000,
+    "D|A": 0b0010101, "D|M": 0b1010101,
+}
+# commutative spellings the VM translator emits (M=M+D, A=M+D, ...)
+for _comp in list(COMP):
+    if len(_comp) == 3 and _comp[1] in "+&|":
+        COMP[_comp[2] + _comp[1] + _comp[0]] = COMP[_comp]
+
+JUMP = {"": 0, "JGT": 1, "JEQ": 2, "JGE": 3, "JLT": 4, "JNE": 5, "JLE": 6, "JMP": 7}
+
+
+def encode_c(line):
+    dest, _, rest = line.rpartition("=")
+    comp, _, jump = rest.partition(";")
+    if comp not in COMP or jump not in JUMP or set(dest) - set("AMD"):
+        raise ValueError(f"bad instruction: {line}")
+
+    d = ("A" in dest) << 2 | ("D" in dest) << 1 | ("M" in dest)
+    return 0b111 << 13 | COMP[comp] << 6 | d << 3 | JUMP[jump]
+
+
+class Assembler:
+    def __init__(self):
+        self.symbols = dict(PREDEFINED)
+        self.labels = {}
+        self.variables = {}
+        self.next_variable = VARIABLE_BASE
+        self.seconds = 0.0
+
+    def assemble(self, lines):
+        # -> array('H') of machine words
+        start = time.perf_counter()
+
+        # pass 1: labels get the ROM address of the next instruction
+        code = []
+        for n, line in enumerate(lines, 1):
+            if "//" in line:
+                line = line[:line.index("//")]
+            line = line.strip()
+            if not line:
+                continue
+            if line[0] == "(":
+                label = line[1:-1]
+                if line[-1] != ")" or not SYMBOL.fullmatch(label):
+                    raise ValueError(f"line {n}: bad label {line}")
+                if label in self.symbols:
+                    raise ValueError(f"line {n}: duplicate label {label}")
+                self.symbols[label] = self.labels[label] = len(code)
+            else:
+                code.append((n, line))
+
+        # pass 2: encode, allocating variables on first use
+        words = array("H")
+        symbols = self.symbols
+        c_words = {}
+        for n, line in code:
+            if line[0] == "@":
+                value = line[1:]
+                if value.isdigit():
+                    address = int(value)
+                else:
+                    address = symbols.get(value)
+                    if address is None:
+                        if not SYMBOL.fullmatch(value):
+                            raise ValueError(f"line {n}: bad symbol {line}")
+                        address = symbols[value] = self.variables[value] = self.next_variable
+                        self.next_variable += 1
+                if address > MAX_ADDRESS:
+                    raise ValueError(f"line {n}: {line} does not fit in 15 bits")
+                words.append(address)
+            else:
+                word = c_words.get(line)
+                if word is None:
+                    try:
+                        word = c_words[line] = encode_c(line)
+                    except ValueError as e:
+                        raise ValueError(f"line {n}: {e}") from None
+                words.append(word)
+
+        self.seconds = time.perf_counter() - start
+        return words
+
+    def report(self, words):
+        rate = len(words) / self.seconds if self.seconds else float("inf")
+        lines = [
+            f"ROM: {len(words)} instructions",
+            f"Symbols: {len(self.labels)} labels, {len(self.variables)} variables",
+        ]
+        if self.variables:
+            lines.append(f"Variables: RAM {VARIABLE_BASE}..{self.next_variable - 1}")
+        lines.append(f"Throughput: {rate:,.0f} instructions/s")
+        return "\n".join(lines)
+
+
+# -------------------------------------------------
+# Output
+# -------------------------------------------------
+def write_hack(path, words):
+    with open(path, "w") as f:
+        f.write("".join(f"{w:016b}\n" for w in words))
+
+
+def write_rom(path, words):
+    # packed image, big-endian 16-bit words
+    words = array("H", words)
+    if sys.byteorder == "little":
+        words.byteswap()
+    with open(path, "wb") as f:
+        words.tofile(f)
+
+
+def write_symbols(path, assembler):
+    with open(path, "w") as f:
+        for name, address in assembler.labels.items():
+            f.write(f"{address} {name}\n")
+        for name, address in assembler.variables.items():
+            f.write(f"{address} {name} var\n")
+
+
+# -------------------------------------------------
+# Entry
+# -------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assemble Hack .asm into .hack")
+    parser.add_argument("file", help="Xxx.asm")
+    parser.add_argument("--binary", action="store_true",
+                        help="also write a packed 16-bit ROM image (Xxx.bin)")
+    parser.add_argument("--symbols", action="store_true",
+                        help="also write the label and variable table (Xxx.sym)")
+    parser.add_argument("--report", action="store_true",
+                        help="print symbol counts, variable allocation and throughput")
+    args = parser.parse_args()
+
+    base = os.path.splitext(args.file)[0]
+    with open(args.file) as f:
+        source = f.read().split("\n")
+
+    assembler = Assembler()
+    try:
+        words = assembler.assemble(source)
+    except ValueError as e:
+        sys.exit(f"error: {e}")
+
+    write_hack(base + ".hack", words)
+    if args.binary:
+        write_rom(base + ".bin", words)
+    if args.symbols:
+        write_symbols(base + ".sym", assembler)
+
+    print(f"✔ Assembled {base}.hack")
+    if args.report:
+        print(assembler.report(words))
@@ -1,6 +1,6 @@
-// Coded with the help of GPT (was too tiring)
+# Coded with the help of GPT (was too tiring)
 
-import sys
+import argparse
 import os
 
 ARITHMETIC = {
@@ -19,14 +19,52 @@ SEGMENTS = {
 TEMP_BASE = 5
 POINTER_BASE = 3  # 3 = THIS, 4 = THAT
 
+JUMPS = {
+    "eq": "D;JEQ",
+    "gt": "D;JGT",
+    "lt": "D;JLT"
+}
+
+# Shared comparison routines (compare="shared")
+COMPARE_ROUTINES = {
+    "eq": "VM$EQ",
+    "gt": "VM$GT",
+    "lt": "VM$LT"
+}
+HALT_LABEL = "VM$HALT"
+
+# lines buffered before a streaming translator writes them out
+CHUNK_SIZE = 4096
+
+
+def rom_size(asm):
+    # number of real instructions, i.e. without labels and comments
+    return sum(1 for line in asm if line and line[0] not in "(/")
+
+
+def label_count(asm):
+    return sum(1 for line in asm if line.startswith("("))
+
 
 class VMTranslator:
-    def __init__(self, filename):
+    def __init__(self, filename, compare="inline", stream=False, chunk_size=CHUNK_SIZE):
         self.filename = filename
         self.filebase = os.path.splitext(os.path.basename(filename))[0]
         self.output = []
         self.label_id = 0
 
+        # compare: "inline" (faster) or "shared" (smaller, one routine
+        # per eq/gt/lt called with a return address)
+        self.compare = compare
+        self.runtime = set()
+
+        # stream: write the .asm in chunks of about chunk_size lines
+        # instead of keeping the whole program in self.output
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.sink = None
+        self.lines_written = 0
+
     def unique_label(self, base):
         self.label_id += 1
         return f"{base}.{self.label_id}"
@@ -67,6 +105,16 @@ class VMTranslator:
                 "M=" + ("-M" if cmd == "neg" else "!M")
             ]
 
+        elif cmd in {"eq", "gt", "lt"} and self.compare == "shared":
+            routine = COMPARE_ROUTINES[cmd]
+            ret = self.unique_label("RET")
+            self.runtime.add(routine)
+            self.output += [
+                f"@{ret}", "D=A",
+                f"@{routine}", "0;JMP",
+                f"({ret})"
+            ]
+
         elif cmd in {"eq", "gt", "lt"}:
             self.pop_to_d()
             self.output += [
@@ -77,15 +125,9 @@ class VMTranslator:
             true_label = self.unique_label("TRUE")
             end_label = self.unique_label("END")
 
-            jump = {
-                "eq": "D;JEQ",
-                "gt": "D;JGT",
-                "lt": "D;JLT"
-            }[cmd]
-
             self.output += [
                 f"@{true_label}",
-                jump,
+                JUMPS[cmd],
                 "@SP", "A=M", "M=0",
                 f"@{end_label}",
                 "0;JMP",
@@ -95,6 +137,38 @@ class VMTranslator:
                 "@SP", "M=M+1"
             ]
 
+    def write_compare_routine(self, cmd):
+        routine = COMPARE_ROUTINES[cmd]
+        end_label = f"{routine}.END"
+
+        # R15 = return address (passed in D)
+        self.output += [f"({routine})", "@R15", "M=D"]
+
+        # D = x - y, leave x's slot holding true
+        self.output += [
+            "@SP", "AM=M-1", "D=M",
+            "A=A-1", "D=M-D", "M=-1",
+            f"@{end_label}", JUMPS[cmd],
+            "@SP", "A=M-1", "M=0",
+            f"({end_label})"
+        ]
+
+        self.output += ["@R15", "A=M", "0;JMP"]
+
+    # ---------------- Runtime ----------------
+    def write_runtime(self):
+        if not self.runtime:
+            return
+
+        # keep the program from running into the routines
+        self.output += [
+            "// runtime",
+            f"({HALT_LABEL})", f"@{HALT_LABEL}", "0;JMP"
+        ]
+        for cmd, routine in COMPARE_ROUTINES.items():
+            if routine in self.runtime:
+                self.write_compare_routine(cmd)
+
     # ---------------- Push ----------------
     def write_push(self, segment, index):
         if segment == "constant":
@@ -160,38 +234,79 @@ class VMTranslator:
             ]
 
     # ---------------- Main ----------------
-    def translate(self):
+    def generate(self):
         with open(self.filename) as f:
-            lines = f.readlines()
+            for line in f:
+                line = line.split("//")[0].strip()
+                if not line:
+                    continue
+
+                parts = line.split()
+                cmd = parts[0]
 
-        for line in lines:
-            line = line.split("//")[0].strip()
-            if not line:
-                continue
+                if cmd in ARITHMETIC:
+                    self.write_arithmetic(cmd)
 
-            parts = line.split()
-            cmd = parts[0]
+                elif cmd == "push":
+                    self.write_push(parts[1], int(parts[2]))
 
-            if cmd in ARITHMETIC:
-                self.write_arithmetic(cmd)
+                elif cmd == "pop":
+                    self.write_pop(parts[1], int(parts[2]))
 
-            elif cmd == "push":
-                self.write_push(parts[1], int(parts[2]))
+                if self.sink and len(self.output) >= self.chunk_size:
+                    self.flush()
 
-            elif cmd == "pop":
-                self.write_pop(parts[1], int(parts[2]))
+        self.write_runtime()
+        return self.output
 
+    def flush(self):
+        if self.output:
+            if self.lines_written:
+                self.sink.write("\n")
+            self.sink.write("\n".join(self.output))
+            self.lines_written += len(self.output)
+            self.output = []
+
+    def translate(self):
         out_file = self.filename.replace(".vm", ".asm")
-        with open(out_file, "w") as f:
-            f.write("\n".join(self.output))
+
+        if self.stream:
+            with open(out_file, "w") as f:
+                self.sink = f
+                self.generate()
+                self.flush()
+        else:
+            self.generate()
+            with open(out_file, "w") as f:
+                f.write("\n".join(self.output))
 
         print(f"✔ Translated: {out_file}")
+        return self.output
 
 
 # ---------------- Entry ----------------
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python vm_translator.py Xxx.vm")
-        sys.exit(1)
-
-    VMTranslator(sys.argv[1]).translate()
+    parser = argparse.ArgumentParser(description="Translate a .vm file to Hack assembly")
+    parser.add_argument("file", help="Xxx.vm")
+    parser.add_argument("--compare", choices=["inline", "shared"], default="inline",
+                        help="eq/gt/lt inline (faster) or as shared routines (smaller)")
+    parser.add_argument("--stream", action="store_true",
+                        help="write the .asm in chunks instead of building it in memory")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, metavar="LINES",
+                        help=f"lines buffered per write in --stream mode (default {CHUNK_SIZE})")
+    parser.add_argument("--report", action="store_true",
+                        help="print the ROM size against an inline translation")
+    args = parser.parse_args()
+
+    asm = VMTranslator(args.file, compare=args.compare,
+                       stream=args.stream, chunk_size=args.chunk_size).translate()
+
+    if args.report:
+        if args.stream:
+            with open(args.file.replace(".vm", ".asm")) as f:
+                asm = f.read().split("\n")
+        baseline = VMTranslator(args.file).generate()
+        before, after = rom_size(baseline), rom_size(asm)
+        print(f"ROM: {before} -> {after} instructions ({after - before:+d})")
+        before, after = label_count(baseline), label_count(asm)
+        print(f"Labels: {before} -> {after} ({after - before:+d})")
@@ -0,0 +1,174 @@
+# Benchmarks for the VM translator on synthetic programs
+#
+#   python bench.py stream            peak RSS against input size
+#   python bench.py jobs              translation time for 1..16 workers
+#   python bench.py codegen [DIR]     ROM size and emulated cycles per
+#                                     code generation option
+
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TRANSLATOR = os.path.join(HERE, "vm_translator.py")
+
+# the Hack emulator lives with Project 5, the assembler with Project 6
+EMULATOR_DIR = os.path.join(HERE, "..", "Project-05")
+ASSEMBLER_DIR = os.path.join(HERE, "..", "Project-06")
+
+CODEGEN_OPTIONS = ["", "cache-top", "fuse-compares", "cache-top,fuse-compares", "inline"]
+
+
+# -------------------------------------------------
+# Synthetic programs
+# -------------------------------------------------
+def function_vm(cls, j, functions):
+    lines = [
+        f"function {cls}.f{j} 2",
+        "push constant 0", "pop local 0",
+        "label LOOP",
+        "push local 0", "push argument 0", "lt", "not", "if-goto END",
+        "push local 1", "push local 0", "add", "pop local 1",
+        "push local 0", "push constant 1", "add", "pop local 0",
+        "goto LOOP",
+        "label END",
+        "push local 1", f"push static {j}", "gt", f"pop static {j}",
+    ]
+    if j + 1 < functions:
+        lines += ["push argument 0", f"call {cls}.f{j + 1} 1", "pop temp 0"]
+    lines += ["push local 1", "return"]
+    return lines
+
+
+def synthesize(directory, classes, functions=8):
+    # Sys.vm plus `classes` classes of loop/compare/call-heavy functions
+    os.makedirs(directory, exist_ok=True)
+    for k in range(classes):
+        with open(os.path.join(directory, f"C{k}.vm"), "w") as f:
+            for j in range(functions):
+                f.write("\n".join(function_vm(f"C{k}", j, functions)) + "\n")
+
+    with open(os.path.join(directory, "Sys.vm"), "w") as f:
+        f.write("function Sys.init 0\n")
+        for k in range(classes):
+            f.write(f"push constant 3\ncall C{k}.f0 1\npop temp 0\n")
+        f.write("label HALT\ngoto HALT\n")
+    return directory
+
+
+def input_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)
+               if f.endswith(".vm"))
+
+
+def run(cmd):
+    # (seconds, peak RSS in KiB) of one child process
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(proc.pid, 0)
+    if status:
+        sys.exit(f"failed: {' '.join(cmd)}")
+    return time.perf_counter() - start, usage.ru_maxrss
+
+
+# -------------------------------------------------
+# Benchmarks
+# -------------------------------------------------
+def bench_stream(args):
+    print(f"{'input':>10} {'buffered':>12} {'streamed':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for classes in args.classes:
+            path = synthesize(os.path.join(tmp, f"P{classes}"), classes)
+            _, buffered = run([sys.executable, TRANSLATOR, path, "--no-cache"])
+            _, streamed = run([sys.executable, TRANSLATOR, path, "--no-cache", "--stream"])
+            size = input_size(path) / 2**20
+            print(f"{size:8.1f}MB {buffered / 1024:10.1f}MB {streamed / 1024:10.1f}MB")
+
+
+def bench_jobs(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = synthesize(os.path.join(tmp, "P"), args.classes)
+        out = os.path.join(path, "P.asm")
+        print(f"{input_size(path) / 2**20:.1f}MB of .vm in {args.classes + 1} files")
+        print(f"{'jobs':>4} {'seconds':>8} {'speedup':>8}  output")
+
+        base = digest = None
+        for jobs in args.jobs:
+            seconds, _ = run([sys.executable, TRANSLATOR, path, "--no-cache", "--jobs", str(jobs)] + args.flags)
+            with open(out, "rb") as f:
+                digest = hashlib.sha1(f.read()).hexdigest()[:12]
+            base = base or (seconds, digest)
+            same = "same" if digest == base[1] else "DIFFERENT"
+            print(f"{jobs:4} {seconds:8.2f} {base[0] / seconds:7.2f}x  {digest} {same}")
+
+
+def bench_codegen(args):
+    sys.path.insert(0, EMULATOR_DIR)
+    sys.path.insert(0, ASSEMBLER_DIR)
+    from hack_emulator import HackMachine
+    from hack_assembler import Assembler
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path or synthesize(os.path.join(tmp, "P"), args.classes)
+        path = os.path.abspath(path)
+        out = os.path.join(path, os.path.basename(path) + ".asm")
+        print(f"{'ROM':>8} {'':>7} {'cycles':>12} {'':>7} {'stop':>6}  result              options")
+
+        base = None
+        for options in args.options:
+            flags = [f"--{name}" for name in options.split(",") if name]
+            run([sys.executable, TRANSLATOR, path, "--no-cache"] + flags)
+            assembler = Assembler()
+            with open(out) as f:
+                words = assembler.assemble(f.read().split("\n"))
+            machine = HackMachine(words, blocks=True)
+            until = assembler.labels[args.until] if args.until else None
+            reason = machine.run(until_pc=until, max_cycles=args.cycles)
+
+            # statics and temps, which the stack layout does not change
+            # (--static-frames puts locals after the statics)
+            ram = machine.ram
+            statics = ram[16:assembler.next_variable]
+            digest = hashlib.sha1(bytes(ram[5:13]) + bytes(statics)).hexdigest()[:12]
+            base = base or (len(words), machine.cycles, digest)
+            same = "same" if digest == base[2] else "DIFFERENT"
+            print(f"{len(words):8} {100 * (len(words) / base[0] - 1):+6.1f}% "
+                  f"{machine.cycles:12} {100 * (machine.cycles / base[1] - 1):+6.1f}% "
+                  f"{reason:>6}  {digest} {same:9}  {' '.join(flags) or '(default)'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VM translator benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("stream", help="peak RSS of buffered vs. streamed output")
+    p.add_argument("--classes", type=int, nargs="+", default=[50, 200, 800, 3200])
+    p.set_defaults(run=bench_stream)
+
+    p = sub.add_parser("jobs", help="scaling of --jobs on one large program")
+    p.add_argument("--classes", type=int, default=2000)
+    p.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    p.add_argument("--flags", nargs=argparse.REMAINDER, default=[],
+                   help="extra vm_translator.py options, e.g. --flags --peephole")
+    p.set_defaults(run=bench_jobs)
+
+    p = sub.add_parser("codegen", help="ROM size and cycles per code generation option")
+    p.add_argument("path", nargs="?",
+                   help="directory of .vm files, e.g. a compiled Pong with the OS "
+                        "(default: a synthetic program)")
+    p.add_argument("--classes", type=int, default=4)
+    p.add_argument("--cycles", type=int, default=50_000_000,
+                   help="stop after this many instructions")
+    p.add_argument("--until", metavar="LABEL",
+                   help="stop when pc reaches LABEL, for programs that never halt")
+    p.add_argument("--options", nargs="+", default=CODEGEN_OPTIONS, metavar="SET",
+                   help='vm_translator.py option sets to compare, each one comma-separated '
+                        'without the dashes ("" = default), e.g. "" cache-top,peephole')
+    p.set_defaults(run=bench_codegen)
+
+    args = parser.parse_args()
+    args.run(args)
@@ -0,0 +1,183 @@
+# Inline expansion of tiny VM functions at their call sites
+#
+# `call f n` becomes f's body, run in the caller's frame. The caller gets
+# extra locals for f's arguments and locals (and for its own THIS/THAT
+# when f sets pointer 0/1, which return would have restored):
+#
+#   pop local a+n-1 ... pop local a        the arguments, top of stack last
+#   push constant 0, pop local a+n+j       f's locals start at 0
+#   push pointer p, pop local s            save THIS/THAT
+#   body, argument i -> local a+i, local j -> local a+n+j, labels renamed
+#   push local s, pop pointer p            restore THIS/THAT
+#
+# f qualifies when its body is at most max_size commands and ends in its
+# only return, with exactly the return value on its working stack there;
+# f's statics belong to f's file, so f is only inlined into its own file.
+# Sites are taken smallest function first, in program order, while the
+# added commands stay within budget (a fraction of the program size).
+
+from tree_shake import function_ranges
+from vm_ir import (
+    ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+    PUSH, POP, LABEL, GOTO, IF_GOTO, FUNCTION, CALL, RETURN,
+    CONSTANT, LOCAL, ARGUMENT, POINTER, STATIC,
+    VMProgram
+)
+
+INLINE_SIZE = 8
+INLINE_BUDGET = 0.1
+
+# working stack change of each command (call: 1 - nargs)
+STACK_EFFECT = {
+    ADD: -1, SUB: -1, AND: -1, OR: -1, EQ: -1, GT: -1, LT: -1,
+    NEG: 0, NOT: 0, PUSH: 1, POP: -1,
+    LABEL: 0, GOTO: 0, IF_GOTO: -1, RETURN: -1
+}
+
+
+def balanced(program, start, end):
+    # whether every path through the body start..end (return last) has a
+    # consistent stack depth that never drops below 0 and is 1 at return
+    ops, args, nums = program.ops, program.args, program.nums
+    labels = {args[i]: i for i in range(start, end) if ops[i] == LABEL}
+    depth = {start: 0}
+    todo = [start]
+    while todo:
+        i = todo.pop()
+        op, d = ops[i], depth[i]
+        if op == RETURN:
+            if d != 1:
+                return False
+            continue
+        if op == CALL and d < nums[i]:
+            return False
+        d += 1 - nums[i] if op == CALL else STACK_EFFECT[op]
+        if d < 0:
+            return False
+
+        targets = []
+        if op in (GOTO, IF_GOTO):
+            if args[i] not in labels:
+                return False
+            targets.append(labels[args[i]])
+        if op != GOTO:
+            targets.append(i + 1)
+        for j in targets:
+            if j >= end:
+                return False
+            if j not in depth:
+                depth[j] = d
+                todo.append(j)
+            elif depth[j] != d:
+                return False
+    return True
+
+
+def candidates(program, max_size):
+    # function symbol id -> (body start, body end without the return,
+    # nlocals, pointers the body sets)
+    ops, args, nums = program.ops, program.args, program.nums
+    found = {}
+    for name, start, end in function_ranges(program):
+        if name is None or ops[start] != FUNCTION:
+            continue
+        body = range(start + 1, end)
+        if (len(body) - 1 <= max_size and ops[end - 1] == RETURN
+                and sum(ops[i] == RETURN for i in body) == 1
+                and balanced(program, start + 1, end)):
+            saves = [p for p in (0, 1) if any(ops[i] == POP and args[i] == POINTER and nums[i] == p
+                                              for i in body)]
+            found[name] = (start + 1, end - 1, nums[start], saves)
+    return found
+
+
+def expansion(program, callee, nargs, base, site):
+    # the (op, arg, num) commands replacing one `call callee nargs` whose
+    # first extra local is base; site makes the label names unique
+    ops, args, nums = program.ops, program.args, program.nums
+    start, end, nlocals, saves = callee
+    name = program.symbols[args[start - 1]]
+    save_slot = {p: base + nargs + nlocals + k for k, p in enumerate(saves)}
+
+    out = [(POP, LOCAL, base + i) for i in reversed(range(nargs))]
+    for j in range(nlocals):
+        out += [(PUSH, CONSTANT, 0), (POP, LOCAL, base + nargs + j)]
+    for p in saves:
+        out += [(PUSH, POINTER, p), (POP, LOCAL, save_slot[p])]
+
+    for i in range(start, end):
+        op, arg, num = ops[i], args[i], nums[i]
+        if op in (PUSH, POP) and arg == ARGUMENT:
+            arg, num = LOCAL, base + num
+        elif op in (PUSH, POP) and arg == LOCAL:
+            num = base + nargs + num
+        elif op in (LABEL, GOTO, IF_GOTO):
+            arg = program.intern(f"{name}${site}${program.symbols[arg]}")
+        out.append((op, arg, num))
+
+    for p in reversed(saves):
+        out += [(PUSH, LOCAL, save_slot[p]), (POP, POINTER, p)]
+    return out
+
+
+def inline(program, max_size=INLINE_SIZE, budget=INLINE_BUDGET):
+    # -> (program with the calls expanded, {function name: sites inlined},
+    # commands added)
+    ops, args, nums, files = program.ops, program.args, program.nums, program.files
+    found = candidates(program, max_size)
+    if not found:
+        return program, {}, 0
+
+    # the function and file every call site is in
+    sites = []
+    function_start = {}
+    for name, start, end in function_ranges(program):
+        for i in range(start, end):
+            if ops[i] == CALL and args[i] in found and name is not None and name != args[i]:
+                sites.append(i)
+                function_start[i] = start
+
+    callee_file = {name: files[body[0] - 1] for name, body in found.items()}
+    uses_static = {name for name, (start, end, _, _) in found.items()
+                   if any(ops[i] in (PUSH, POP) and args[i] == STATIC for i in range(start, end))}
+
+    # pick sites within the budget, smallest functions first
+    allowance = int(budget * len(program))
+    chosen = set()
+    for i in sorted(sites, key=lambda i: (found[args[i]][1] - found[args[i]][0], i)):
+        callee = args[i]
+        if callee in uses_static and files[i] != callee_file[callee]:
+            continue
+        start, end, nlocals, saves = found[callee]
+        # argument pops, zeroed locals, body and THIS/THAT saves, minus the call
+        growth = nums[i] + 2 * nlocals + end - start + 4 * len(saves) - 1
+        if growth <= allowance:
+            allowance -= growth
+            chosen.add(i)
+    if not chosen:
+        return program, {}, 0
+
+    # extra locals per caller, shared by all of its sites
+    extra = {}
+    for i in chosen:
+        _, _, nlocals, saves = found[args[i]]
+        size = nums[i] + nlocals + len(saves)
+        extra[function_start[i]] = max(extra.get(function_start[i], 0), size)
+
+    result = VMProgram()
+    result.symbols = program.symbols
+    result.symbol_ids = program.symbol_ids
+    counts = {}
+    base = 0
+    for i in range(len(program)):
+        if ops[i] == FUNCTION:
+            base = nums[i]
+            result.append(FUNCTION, args[i], nums[i] + extra.get(i, 0), files[i], program.lines[i])
+        elif i in chosen:
+            name = program.symbols[args[i]]
+            counts[name] = counts.get(name, 0) + 1
+            for op, arg, num in expansion(program, found[args[i]], nums[i], base, len(result)):
+                result.append(op, arg, num, files[i], program.lines[i])
+        else:
+            result.append(ops[i], args[i], nums[i], files[i], program.lines[i])
+    return result, counts, len(result) - len(program)
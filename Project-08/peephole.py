@@ -0,0 +1,134 @@
+# Peephole optimizer for the Hack assembly emitted by vm_translator.py
+#
+# Every rule looks at the window starting at lines[i] and returns
+# (consumed, replacement) when it applies, or None. Windows never contain
+# labels, so no jump target can land inside a rewritten sequence.
+
+from collections import Counter
+
+PUSH_D = ["@SP", "A=M", "M=D", "@SP", "M=M+1"]
+POP_TO_D = ["@SP", "M=M-1", "A=M", "D=M"]
+
+# Past this index, walking A up with A=A+1 costs more than going through R15
+WALK_LIMIT = 6
+
+
+def is_c_instruction(line):
+    return bool(line) and line[0] not in "@(/"
+
+
+def writes_a(line):
+    dest = line.split("=")[0] if "=" in line else ""
+    return "A" in dest or ";" in line
+
+
+# -------------------------------------------------
+# Rules
+# -------------------------------------------------
+def push_pop(lines, i):
+    # push_d + pop_to_d leaves D as it was; only A changes, so the next
+    # instruction has to reload it
+    end = i + len(PUSH_D) + len(POP_TO_D)
+    if lines[i:end] == PUSH_D + POP_TO_D and end < len(lines) and lines[end].startswith("@"):
+        return end - i, []
+    return None
+
+
+def push_pop_segment(lines, i):
+    # push X; pop local/argument/this/that i -> store D directly
+    j = i + len(PUSH_D)
+    if lines[i:j] != PUSH_D or j + 6 > len(lines):
+        return None
+
+    index, load, base, addr, r13, store = lines[j:j + 6]
+    if not (index.startswith("@") and index[1:].isdigit() and load == "D=A"
+            and base in ("@LCL", "@ARG", "@THIS", "@THAT")
+            and [addr, r13, store] == ["D=M+D", "@R13", "M=D"]):
+        return None
+
+    k = j + 6
+    end = k + len(POP_TO_D) + 3
+    if lines[k:end] != POP_TO_D + ["@R13", "A=M", "M=D"]:
+        return None
+
+    n = int(index[1:])
+    if n <= WALK_LIMIT:
+        return end - i, [base, "A=M"] + ["A=A+1"] * n + ["M=D"]
+    return end - i, [
+        "@R15", "M=D",
+        index, "D=A", base, "D=M+D", "@R13", "M=D",
+        "@R15", "D=M",
+        "@R13", "A=M", "M=D"
+    ]
+
+
+def sp_inc_dec(lines, i):
+    if lines[i:i + 4] == ["@SP", "M=M+1", "@SP", "M=M-1"]:
+        return 4, ["@SP"]
+    return None
+
+
+def sp_dec_fold(lines, i):
+    if lines[i:i + 3] == ["@SP", "M=M-1", "A=M"]:
+        return 3, ["@SP", "AM=M-1"]
+    return None
+
+
+def redundant_load(lines, i):
+    # @X; <C-instruction that keeps A>; @X -> drop the second @X
+    if (i + 2 < len(lines) and lines[i].startswith("@") and lines[i + 2] == lines[i]
+            and is_c_instruction(lines[i + 1]) and not writes_a(lines[i + 1])):
+        return 3, lines[i:i + 2]
+    return None
+
+
+# Applied in this order at every position
+RULES = {
+    "push-pop": push_pop,
+    "push-pop-segment": push_pop_segment,
+    "sp-inc-dec": sp_inc_dec,
+    "redundant-load": redundant_load,
+    "sp-dec-fold": sp_dec_fold,
+}
+
+
+# -------------------------------------------------
+# Driver
+# -------------------------------------------------
+def optimize(lines, rules=None, stats=None, origins=None):
+    # rules: names from RULES (default: all of them)
+    # stats: Counter updated with the instructions each rule removed
+    # origins: list parallel to lines, rewritten in place to stay parallel
+    #          to the result; a replacement takes the origin of the first
+    #          line it consumed
+    rules = [(name, RULES[name]) for name in (rules or RULES)]
+    stats = Counter() if stats is None else stats
+
+    changed = True
+    while changed:
+        changed = False
+        out = []
+        out_origins = [] if origins is not None else None
+        i = 0
+        while i < len(lines):
+            for name, rule in rules:
+                match = rule(lines, i)
+                if match:
+                    consumed, replacement = match
+                    out += replacement
+                    if origins is not None:
+                        out_origins += [origins[i]] * len(replacement)
+                    stats[name] += consumed - len(replacement)
+                    i += consumed
+                    changed = True
+                    break
+            else:
+                out.append(lines[i])
+                if origins is not None:
+                    out_origins.append(origins[i])
+                i += 1
+        lines = out
+        if origins is not None:
+            origins[:] = out_origins
+
+    return lines
@@ -0,0 +1,174 @@
+# Source maps: generated line/instruction -> (source file, line, column)
+#
+# Used for Xxx.asm.map (ROM address -> .vm file and line, written by
+# vm_translator.py --source-map) and Xxx.vm.map (VM line -> .jack file,
+# line and column, written by jackCompiler.py --source-map).
+#
+# A map only stores the positions where the source changes, as a run table
+# sorted by generated position; looking up a position is a bisect for the
+# last entry at or before it. On disk:
+#
+#   b"SMAP" version
+#   varint file count, then per file: varint length, UTF-8 name
+#   varint entry count, then per entry the deltas from the previous entry:
+#       varint position, zigzag file, zigzag line, zigzag column
+#
+# File 0 is the empty name and marks generated code without a source (the
+# bootstrap, the shared runtime routines).
+
+import argparse
+import sys
+from array import array
+from bisect import bisect_right
+
+MAGIC = b"SMAP"
+VERSION = 1
+
+
+def write_varint(out, n):
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(data, i):
+    # -> (value, next index)
+    n = shift = 0
+    while True:
+        b = data[i]
+        i += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, i
+        shift += 7
+
+
+def zigzag(n):
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def unzigzag(n):
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+class SourceMap:
+    def __init__(self):
+        self.files = [""]
+        self.file_ids = {"": 0}
+        self.positions = array("I")
+        self.file = array("H")
+        self.lines = array("I")
+        self.columns = array("I")
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, position, file, line, column=0):
+        # positions must not decrease; a position with the same source as
+        # the entry before it adds nothing
+        fid = self.file_ids.get(file)
+        if fid is None:
+            fid = self.file_ids[file] = len(self.files)
+            self.files.append(file)
+
+        if self.positions:
+            last = len(self.positions) - 1
+            if (self.file[last], self.lines[last], self.columns[last]) == (fid, line, column):
+                return
+            if self.positions[last] == position:
+                self.file[last], self.lines[last], self.columns[last] = fid, line, column
+                return
+        self.positions.append(position)
+        self.file.append(fid)
+        self.lines.append(line)
+        self.columns.append(column)
+
+    def lookup(self, position):
+        # (file, line, column) of a generated position, None without a source
+        i = bisect_right(self.positions, position) - 1
+        if i < 0 or not self.file[i]:
+            return None
+        return self.files[self.file[i]], self.lines[i], self.columns[i]
+
+    # -------------------------------------------------
+    # Encoding
+    # -------------------------------------------------
+    def to_bytes(self):
+        out = bytearray(MAGIC)
+        out.append(VERSION)
+        write_varint(out, len(self.files))
+        for name in self.files:
+            data = name.encode()
+            write_varint(out, len(data))
+            out += data
+
+        write_varint(out, len(self.positions))
+        prev = (0, 0, 0, 0)
+        for entry in zip(self.positions, self.file, self.lines, self.columns):
+            write_varint(out, entry[0] - prev[0])
+            for k in 1, 2, 3:
+                write_varint(out, zigzag(entry[k] - prev[k]))
+            prev = entry
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:4] != MAGIC or data[4] != VERSION:
+            raise ValueError("not a source map")
+        smap = cls()
+        i = 5
+        count, i = read_varint(data, i)
+        smap.files = []
+        for _ in range(count):
+            length, i = read_varint(data, i)
+            smap.files.append(data[i:i + length].decode())
+            i += length
+        smap.file_ids = {name: fid for fid, name in enumerate(smap.files)}
+
+        count, i = read_varint(data, i)
+        position = fid = line = column = 0
+        for _ in range(count):
+            delta, i = read_varint(data, i)
+            position += delta
+            delta, i = read_varint(data, i)
+            fid += unzigzag(delta)
+            delta, i = read_varint(data, i)
+            line += unzigzag(delta)
+            delta, i = read_varint(data, i)
+            column += unzigzag(delta)
+            smap.positions.append(position)
+            smap.file.append(fid)
+            smap.lines.append(line)
+            smap.columns.append(column)
+        return smap
+
+    def write(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+
+def load(path):
+    with open(path, "rb") as f:
+        return SourceMap.from_bytes(f.read())
+
+
+# -------------------------------------------------
+# Entry
+# -------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look up positions in a source map")
+    parser.add_argument("map", help="Xxx.asm.map or Xxx.vm.map")
+    parser.add_argument("positions", type=int, nargs="*",
+                        help="ROM addresses / VM lines to look up (default: dump the map)")
+    args = parser.parse_args()
+
+    smap = load(args.map)
+    if not args.positions:
+        for position, fid, line, column in zip(smap.positions, smap.file, smap.lines, smap.columns):
+            print(f"{position:8}  {smap.files[fid] or '-'}:{line}:{column}")
+        sys.exit()
+
+    for position in args.positions:
+        origin = smap.lookup(position)
+        print(f"{position:8}  " + (f"{origin[0]}:{origin[1]}:{origin[2]}" if origin else "-"))
@@ -0,0 +1,106 @@
+# Static frames for functions that are never active twice at once
+#
+# A function outside every cycle of the call graph has at most one
+# activation at a time, so its locals can live at fixed RAM addresses
+# instead of behind LCL. Two such functions share addresses when neither
+# can be below the other on the stack: every frame goes after the frames
+# of all functions that can call into it (a longest path over the call
+# graph with its cycles collapsed). The frames fill the top of the
+# variable area, up to STACK_BASE, where the stack cannot reach them; the
+# assembler hands out the rest of that area to statics from VARIABLE_BASE
+# up, so the statics and frames together must fit in it.
+#
+# Calls to functions that are not in the program are taken as leaves.
+
+from tree_shake import call_graph, function_ranges
+from vm_ir import FUNCTION, PUSH, POP, STATIC
+
+VARIABLE_BASE = 16
+STACK_BASE = 256
+
+
+def components(graph):
+    # strongly connected components of the call graph, callees first
+    # (Tarjan's algorithm without recursion)
+    index, low, on_stack = {}, {}, set()
+    stack, result = [], []
+    for root in graph:
+        if root in index:
+            continue
+        work = [(root, iter(graph[root]))]
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, callees = work[-1]
+            for callee in callees:
+                if callee not in graph:
+                    continue
+                if callee not in index:
+                    index[callee] = low[callee] = len(index)
+                    stack.append(callee)
+                    on_stack.add(callee)
+                    work.append((callee, iter(graph[callee])))
+                    break
+                if callee in on_stack:
+                    low[node] = min(low[node], index[callee])
+            else:
+                work.pop()
+                if work:
+                    caller = work[-1][0]
+                    low[caller] = min(low[caller], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    result.append(component)
+    return result
+
+
+def count_statics(program):
+    # static variables the assembler will allocate (File.i)
+    return len({(program.files[i], program.nums[i]) for i in range(len(program))
+                if program.ops[i] in (PUSH, POP) and program.args[i] == STATIC})
+
+
+def assign(program):
+    # -> {function name: (address, locals)} for the functions with locals
+    # that are never active twice at once
+    ranges = function_ranges(program)
+    graph = call_graph(program, ranges)
+    nlocals = {}
+    for name, start, end in ranges:
+        if name is not None and program.ops[start] == FUNCTION:
+            nlocals[name] = program.nums[start]
+
+    # offsets from the bottom of the frame area, callers before callees
+    order = components(graph)
+    order.reverse()
+    component_of = {name: k for k, members in enumerate(order) for name in members}
+    start = [0] * len(order)
+    offsets = {}
+    for k, members in enumerate(order):
+        name = members[0]
+        static = len(members) == 1 and name not in graph[name] and name in nlocals
+        end = start[k]
+        if static and nlocals[name]:
+            offsets[name] = start[k]
+            end += nlocals[name]
+        for member in members:
+            for callee in graph[member]:
+                if callee in component_of and component_of[callee] != k:
+                    start[component_of[callee]] = max(start[component_of[callee]], end)
+        start[k] = end  # now the end of this component's frames
+
+    total = max(start, default=0)
+    base = STACK_BASE - total
+    statics = count_statics(program)
+    if VARIABLE_BASE + statics > base:
+        raise ValueError(f"static frames need {total} words and statics {statics}, "
+                         f"more than RAM[{VARIABLE_BASE}..{STACK_BASE - 1}]")
+    return {program.symbols[name]: (base + offset, nlocals[name])
+            for name, offset in offsets.items()}
@@ -0,0 +1,69 @@
+# Whole-program dead function elimination
+#
+# The call graph comes from the function/call commands of all files; only
+# the functions reachable from Sys.init are kept and code generation never
+# sees the rest. Commands in front of a file's first function belong to no
+# function and are always kept. A program without Sys.init has no known
+# entry point and is left as it is.
+
+from vm_ir import FUNCTION, CALL
+
+ROOT = "Sys.init"
+
+
+def function_ranges(program):
+    # (function symbol id or None, start, end) for every function body, in
+    # program order; a body ends at the next function or at the end of its file
+    ops, args = program.ops, program.args
+    ranges = []
+    for _, start, end in program.file_ranges():
+        name, begin = None, start
+        for i in range(start, end):
+            if ops[i] == FUNCTION:
+                if i > begin:
+                    ranges.append((name, begin, i))
+                name, begin = args[i], i
+        if end > begin:
+            ranges.append((name, begin, end))
+    return ranges
+
+
+def call_graph(program, ranges):
+    # function symbol id -> ids of the functions it calls
+    ops, args = program.ops, program.args
+    graph = {}
+    for name, start, end in ranges:
+        callees = graph.setdefault(name, set())
+        for i in range(start, end):
+            if ops[i] == CALL:
+                callees.add(args[i])
+    return graph
+
+
+def reachable(graph, roots):
+    seen = set()
+    todo = [root for root in roots if root in graph]
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        todo += [callee for callee in graph[name] if callee in graph and callee not in seen]
+    return seen
+
+
+def shake(program, root=ROOT):
+    # -> (program of the reachable functions, [(name, start, end)] dropped
+    # from the original program)
+    root_id = program.symbol_ids.get(root)
+    ranges = function_ranges(program)
+    graph = call_graph(program, ranges)
+    if root_id not in graph:
+        return program, []
+
+    live = reachable(graph, [root_id, None])
+    kept = [(start, end) for name, start, end in ranges if name in live]
+    dropped = [(program.symbols[name], start, end) for name, start, end in ranges if name not in live]
+    if not dropped:
+        return program, []
+    return program.select(kept), dropped
@@ -0,0 +1,85 @@
+# On-disk cache of translated .vm files
+#
+# An entry holds the asm fragment of one file, keyed by a hash of the file's
+# name and contents (its commands after the whole-program passes, when any
+# run), the translator options and the translator's own source.
+# Labels are numbered per file, so a fragment is valid in any program that
+# contains the file; only the bootstrap and runtime are rebuilt around it.
+
+import hashlib
+import json
+import os
+from collections import Counter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCES = ["vm_translator.py", "vm_ir.py", "peephole.py", "vm_cache.py", "source_map.py",
+           "tree_shake.py", "static_frames.py", "inline.py"]
+
+DEFAULT_MAX_BYTES = 64 * 2**20
+
+
+def code_version():
+    # changes whenever the translator itself changes
+    h = hashlib.sha1()
+    for name in SOURCES:
+        with open(os.path.join(HERE, name), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class TranslationCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = code_version()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, filebase, source, options):
+        h = hashlib.sha1(self.version.encode())
+        h.update(repr(sorted(options.items())).encode())
+        h.update(filebase.encode() + b"\0")
+        h.update(source)
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        # (lines, runtime, stats, VM line per asm line or None) or None
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        os.utime(path)  # most recently used
+        self.hits += 1
+        stats = entry["stats"]
+        return (entry["asm"], set(entry["runtime"]), None if stats is None else Counter(stats),
+                entry.get("vm_lines"))
+
+    def put(self, key, lines, runtime, stats, vm_lines=None):
+        entry = {"asm": lines, "runtime": sorted(runtime), "stats": stats, "vm_lines": vm_lines}
+        tmp = f"{self.path(key)}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self.path(key))
+
+    def evict(self):
+        # drop least recently used entries until the cache fits max_bytes
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((st.st_mtime, st.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
@@ -0,0 +1,599 @@
+# VM interpreter: runs .vm programs directly, without translating to Hack
+#
+# The program is parsed with vm_ir and decoded once into a flat code array
+# in which every command carries its resolved operand: a RAM address for
+# temp/pointer/static, the segment pointer for local/argument/this/that and
+# the target index for jumps and calls. RAM uses the same layout as the
+# translated program (SP/LCL/ARG/THIS/THAT at 0..4, temp at TEMP_BASE,
+# statics from 16 in order of first use, stack from 256), so RAM dumps can
+# be compared with an emulator run of the translator's output.
+#
+# Straight-line code is compiled, on first entry, into one Python function
+# per block (up to the next jump, call or return) that keeps the top of the
+# stack in locals; exact op limits are met by finishing in the per-command
+# loop in interpret().
+#
+# With natives, calls to Math, Memory and String functions run the Python
+# versions in Project-12/os_natives.py instead (and need no OS .vm files).
+
+import argparse
+import os
+import sys
+import time
+from array import array
+from collections import Counter
+
+from vm_ir import (
+    ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+    PUSH, POP, LABEL, GOTO, IF_GOTO, FUNCTION, CALL, RETURN,
+    CONSTANT, TEMP, POINTER, SEGMENT_NAMES,
+    parse
+)
+from vm_translator import SEGMENTS, TEMP_BASE, POINTER_BASE
+
+# the native OS functions live with Project 12
+NATIVES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Project-12")
+
+RAM_SIZE = 32768
+STACK_BASE = 256
+STATIC_BASE = 16
+SP, LCL, ARG, THIS, THAT = range(5)
+POINTERS = {"LCL": LCL, "ARG": ARG, "THIS": THIS, "THAT": THAT}
+
+# decoded opcodes; arithmetic keeps its vm_ir number
+(PUSH_CONSTANT, PUSH_SEGMENT, PUSH_ADDRESS, POP_SEGMENT, POP_ADDRESS,
+ JUMP, JUMP_IF, ENTER, HALT, NATIVE) = range(100, 110)
+
+# commands a block stops before
+CONTROL = {CALL, RETURN, HALT, NATIVE}
+
+# Python expressions of the arithmetic commands over x (below) and y (top)
+BINARY = {
+    ADD: "({x} + {y} + 32768 & 0xFFFF) - 32768",
+    SUB: "({x} - {y} + 32768 & 0xFFFF) - 32768",
+    EQ: "-({x} == {y})",
+    GT: "-(({x} - {y} + 32768 & 0xFFFF) > 32768)",
+    LT: "-(({x} - {y} + 32768 & 0xFFFF) < 32768)",
+    AND: "{x} & {y}",
+    OR: "{x} | {y}",
+}
+UNARY = {NEG: "(32768 - {x} & 0xFFFF) - 32768", NOT: "~{x}"}
+
+
+class VMError(Exception):
+    pass
+
+
+def wrap(value):
+    # 16-bit two's complement, like the Hack ALU
+    return (value + 32768 & 0xFFFF) - 32768
+
+
+def block_source(code, start):
+    # Python source of block(sp) -> (sp, next pc) for the commands from start
+    # up to and including the next jump, the number of commands it runs and
+    # the most it writes above the entry sp; None if start is a call,
+    # return, native call or halt.
+    #
+    # Values pushed inside the block live in locals (t1, t2, ...) or as
+    # constants and only the ones left over are written back to RAM (so RAM
+    # above SP is not the same as after interpret()); a pop that reaches
+    # below them reads RAM.
+    if code[start][0] in CONTROL:
+        return None
+
+    body = []
+    stack = []   # expressions of the values pushed and not yet in RAM
+    depth = 0    # sp relative to the entry sp, without those values
+    reach = 0    # the highest depth written back
+    temps = 0
+
+    def bind(expr):
+        nonlocal temps
+        temps += 1
+        body.append(f"    t{temps} = {expr}")
+        return f"t{temps}"
+
+    def pop():
+        nonlocal depth
+        if stack:
+            return stack.pop()
+        depth -= 1
+        return bind(f"ram[sp - {-depth}]")
+
+    def push(expr, *operands):
+        # folded to a constant when every operand is one
+        if all(x.lstrip("-").isdigit() for x in operands):
+            stack.append(str(eval(expr)))
+        else:
+            stack.append(bind(expr))
+
+    def write_back():
+        # pushed values to RAM; -> the sp expression
+        nonlocal depth, reach
+        for expr in stack:
+            body.append(f"    ram[sp + {depth}] = {expr}")
+            depth += 1
+        reach = max(reach, depth)
+        stack.clear()
+        return f"sp + {depth}" if depth else "sp"
+
+    pc = start
+    while True:
+        op, a, b = code[pc]
+        pc += 1
+        if op == PUSH_CONSTANT:
+            stack.append(str(a))
+        elif op == PUSH_SEGMENT:
+            stack.append(bind(f"ram[ram[{a}] + {b}]"))
+        elif op == PUSH_ADDRESS:
+            stack.append(bind(f"ram[{a}]"))
+        elif op == POP_SEGMENT:
+            body.append(f"    ram[ram[{a}] + {b}] = {pop()}")
+        elif op == POP_ADDRESS:
+            body.append(f"    ram[{a}] = {pop()}")
+        elif op in BINARY:
+            y = pop()
+            x = pop()
+            push(BINARY[op].format(x=x, y=y), x, y)
+        elif op in UNARY:
+            x = pop()
+            push(UNARY[op].format(x=x), x)
+        elif op == ENTER:
+            # the locals are addressed through LCL, so they go to RAM now
+            stack += ["0"] * a
+            write_back()
+        elif op == JUMP_IF:
+            cond = pop()
+            sp = write_back()
+            body.append(f"    return {sp}, {a} if {cond} else {pc}")
+            break
+        elif op == JUMP and a != pc:
+            sp = write_back()
+            body.append(f"    return {sp}, {a}")
+            break
+        elif op in CONTROL:
+            pc -= 1
+            sp = write_back()
+            body.append(f"    return {sp}, {pc}")
+            break
+        # a label (JUMP to the next command) just falls through
+
+        if pc == len(code):
+            sp = write_back()
+            body.append(f"    return {sp}, {pc}")
+            break
+
+    return "\n".join(["def block(sp):"] + body), pc - start, reach
+
+
+class VMInterpreter:
+    def __init__(self, files, blocks=True, natives=None):
+        self.program = parse(files)
+        self.ram = array("h", bytes(2 * RAM_SIZE))
+
+        # natives: names of the OS classes run natively (None = off)
+        self.natives = None
+        self.native_calls = []  # NATIVE operand -> call(*args) -> value
+        if natives is not None:
+            sys.path.insert(0, NATIVES_DIR)
+            from os_natives import NativeOS, NativeError
+
+            try:
+                self.natives = NativeOS(self.ram, natives)
+            except NativeError as e:
+                raise VMError(str(e)) from None
+
+        self.statics = {}
+        self.functions = {}    # name -> code index
+        self.owners = []       # code index -> function name
+        self.code = self.decode()
+
+        # compiled blocks by start index (False: not compilable)
+        self.use_blocks = blocks
+        self.blocks = [None] * len(self.code)
+
+        # ops executed and calls made, per function
+        self.op_counts = Counter()
+        self.call_counts = Counter()
+        self.ops = 0
+
+        self.pc = 0
+        self.function = self.owners[0] if self.owners else ""
+        self.frames = []       # functions of the calling frames, innermost last
+        if "Sys.init" in self.functions:
+            self.bootstrap()
+
+    # -------------------------------------------------
+    # Decode
+    # -------------------------------------------------
+    def static_address(self, filebase, index):
+        name = f"{filebase}.{index}"
+        address = self.statics.get(name)
+        if address is None:
+            address = self.statics[name] = STATIC_BASE + len(self.statics)
+            if address >= STACK_BASE:
+                raise VMError(f"too many static variables ({name})")
+        return address
+
+    def decode(self):
+        # [(opcode, operand, extra)] with labels and functions resolved
+        program = self.program
+        symbols = program.symbols
+        ops, args, nums, files = program.ops, program.args, program.nums, program.files
+
+        # pass 1: code index of every function and (function, label)
+        labels = {}
+        function = ""
+        for i in range(len(program)):
+            if ops[i] == FUNCTION:
+                function = symbols[args[i]]
+                if function in self.functions:
+                    raise VMError(f"duplicate function {function}")
+                self.functions[function] = i
+            elif ops[i] == LABEL:
+                labels[function, symbols[args[i]]] = i + 1  # jumps skip the label
+            self.owners.append(function)
+
+        # pass 2: operands
+        code = []
+        for i in range(len(program)):
+            op, arg, num = ops[i], args[i], nums[i]
+            function = self.owners[i]
+
+            if op == PUSH or op == POP:
+                segment = SEGMENT_NAMES[arg]
+                if segment in SEGMENTS:
+                    code.append((PUSH_SEGMENT if op == PUSH else POP_SEGMENT,
+                                 POINTERS[SEGMENTS[segment]], num))
+                    continue
+                if arg == CONSTANT:
+                    if op == POP:
+                        raise VMError(f"{function}: pop constant {num}")
+                    code.append((PUSH_CONSTANT, wrap(num), 0))
+                    continue
+                if arg == TEMP:
+                    address = TEMP_BASE + num
+                elif arg == POINTER:
+                    address = POINTER_BASE + num
+                else:
+                    address = self.static_address(symbols[files[i]], num)
+                code.append((PUSH_ADDRESS if op == PUSH else POP_ADDRESS, address, 0))
+
+            elif op == GOTO or op == IF_GOTO:
+                target = labels.get((function, symbols[arg]))
+                if target is None:
+                    raise VMError(f"{function}: unknown label {symbols[arg]}")
+                if op == GOTO and target == i:
+                    code.append((HALT, 0, 0))  # label L / goto L
+                else:
+                    code.append((JUMP if op == GOTO else JUMP_IF, target, 0))
+
+            elif op == CALL:
+                hook = self.natives and self.natives.hook(symbols[arg])
+                if hook:
+                    nargs, call = hook
+                    if nargs != num:
+                        raise VMError(f"{function}: {symbols[arg]} takes {nargs} arguments")
+                    code.append((NATIVE, len(self.native_calls), num))
+                    self.native_calls.append(call)
+                    continue
+                target = self.functions.get(symbols[arg])
+                if target is None:
+                    raise VMError(f"{function}: call to unknown function {symbols[arg]}")
+                code.append((CALL, target, num))
+
+            elif op == FUNCTION:
+                code.append((ENTER, num, 0))
+
+            elif op == LABEL:
+                code.append((JUMP, i + 1, 0))  # only reached by falling through
+
+            else:
+                code.append((op, 0, 0))
+        return code
+
+    def bootstrap(self):
+        # SP = 256, call Sys.init 0 (the frame the translator's bootstrap pushes)
+        ram = self.ram
+        ram[SP] = STACK_BASE
+        sp = STACK_BASE
+        ram[sp] = -1  # return address: off the end of the program
+        ram[sp + 1:sp + 5] = ram[LCL:THAT + 1]
+        ram[ARG] = sp
+        ram[LCL] = ram[SP] = sp + 5
+        self.pc = self.functions["Sys.init"]
+        self.function = "Sys.init"
+        self.call_counts["Sys.init"] += 1
+
+    # -------------------------------------------------
+    # Run
+    # -------------------------------------------------
+    def run(self, max_ops=None):
+        # Runs until a halt loop (label L / goto L), the end of the program or
+        # max_ops commands. Returns "halt", "end" or "ops".
+        limit = self.ops + max_ops if max_ops is not None else float("inf")
+        if self.use_blocks:
+            reason = self.run_blocks(limit)
+            if reason is not None:
+                return reason
+        # the rest of an op limit, or without blocks the whole run
+        return self.interpret(limit)
+
+    def compile_block(self, start):
+        block = block_source(self.code, start)
+        if block is None:
+            self.blocks[start] = False
+            return False
+        source, length, reach = block
+        scope = {"ram": self.ram}
+        exec(source, scope)
+        block = self.blocks[start] = (scope["block"], length, reach)
+        return block
+
+    def run_blocks(self, limit):
+        # blocks, calls and returns until the next block would pass limit
+        # (-> None); halts are left to interpret()
+        ram, code, blocks, owners = self.ram, self.code, self.blocks, self.owners
+        natives = self.native_calls
+        op_counts, call_counts, frames = self.op_counts, self.call_counts, self.frames
+        end = len(code)
+        pc, n = self.pc, self.ops
+        sp = ram[SP]
+        mark = n
+        function = self.function
+        reason = None
+
+        while n < limit:
+            if pc >= end:
+                reason = "end"
+                break
+            block = blocks[pc]
+            if block is None:
+                block = self.compile_block(pc)
+            if block:
+                run, length, reach = block
+                if n + length > limit:
+                    break
+                try:
+                    sp, pc = run(sp)
+                except IndexError:
+                    if sp + reach < RAM_SIZE:
+                        raise
+                    raise VMError(f"{function}: stack overflow") from None
+                n += length
+                continue
+
+            op, a, b = code[pc]
+            if op == CALL:
+                if sp + 5 >= RAM_SIZE:
+                    raise VMError(f"{function}: stack overflow")
+                ram[sp] = wrap(pc + 1)
+                ram[sp + 1:sp + 5] = ram[LCL:THAT + 1]
+                ram[ARG] = sp - b
+                sp += 5
+                ram[LCL] = sp
+                n += 1
+                op_counts[function] += n - mark
+                mark = n
+                frames.append(function)
+                function = owners[a]
+                call_counts[function] += 1
+                pc = a
+            elif op == RETURN:
+                frame = ram[LCL]
+                pc = ram[frame - 5] & 0xFFFF
+                ram[ram[ARG]] = ram[sp - 1]
+                sp = ram[ARG] + 1
+                ram[LCL:THAT + 1] = ram[frame - 4:frame]
+                n += 1
+                op_counts[function] += n - mark
+                mark = n
+                function = frames.pop() if frames else ""
+            elif op == NATIVE:
+                sp -= b
+                ram[sp] = natives[a](*ram[sp:sp + b])
+                sp += 1
+                n += 1
+                pc += 1
+            else:
+                reason = "halt"
+                break
+
+        if sp >= RAM_SIZE:
+            raise VMError(f"{function}: stack overflow")
+        op_counts[function] += n - mark
+        self.function = function
+        ram[SP] = sp
+        self.pc, self.ops = pc, n
+        return reason
+
+    def interpret(self, limit):
+        # one command at a time, up to limit commands in all
+        ram, code, owners = self.ram, self.code, self.owners
+        natives = self.native_calls
+        op_counts, call_counts, frames = self.op_counts, self.call_counts, self.frames
+        end = len(code)
+
+        pc, n = self.pc, self.ops
+        sp = ram[SP]
+        mark = n  # ops are charged to the running function on every call/return
+        function = self.function
+        reason = "ops"
+
+        try:
+            while n < limit:
+                if pc >= end:
+                    reason = "end"
+                    break
+                op, a, b = code[pc]
+                n += 1
+                pc += 1
+
+                if op == PUSH_CONSTANT:
+                    ram[sp] = a
+                    sp += 1
+                elif op == PUSH_SEGMENT:
+                    ram[sp] = ram[ram[a] + b]
+                    sp += 1
+                elif op == POP_SEGMENT:
+                    sp -= 1
+                    ram[ram[a] + b] = ram[sp]
+                elif op == PUSH_ADDRESS:
+                    ram[sp] = ram[a]
+                    sp += 1
+                elif op == POP_ADDRESS:
+                    sp -= 1
+                    ram[a] = ram[sp]
+                elif op == ADD:
+                    sp -= 1
+                    ram[sp - 1] = (ram[sp - 1] + ram[sp] + 32768 & 0xFFFF) - 32768
+                elif op == SUB:
+                    sp -= 1
+                    ram[sp - 1] = (ram[sp - 1] - ram[sp] + 32768 & 0xFFFF) - 32768
+                elif op == JUMP_IF:
+                    sp -= 1
+                    if ram[sp]:
+                        pc = a
+                elif op == JUMP:
+                    pc = a
+                elif op == EQ:
+                    sp -= 1
+                    ram[sp - 1] = -(ram[sp - 1] == ram[sp])
+                elif op == LT:
+                    sp -= 1
+                    ram[sp - 1] = -(wrap(ram[sp - 1] - ram[sp]) < 0)
+                elif op == GT:
+                    sp -= 1
+                    ram[sp - 1] = -(wrap(ram[sp - 1] - ram[sp]) > 0)
+                elif op == NOT:
+                    ram[sp - 1] = ~ram[sp - 1]
+                elif op == NEG:
+                    ram[sp - 1] = wrap(-ram[sp - 1])
+                elif op == AND:
+                    sp -= 1
+                    ram[sp - 1] &= ram[sp]
+                elif op == OR:
+                    sp -= 1
+                    ram[sp - 1] |= ram[sp]
+
+                elif op == CALL:
+                    if sp + 5 >= RAM_SIZE:
+                        raise VMError(f"{function}: stack overflow")
+                    ram[sp] = wrap(pc)
+                    ram[sp + 1:sp + 5] = ram[LCL:THAT + 1]
+                    ram[ARG] = sp - b
+                    sp += 5
+                    ram[LCL] = sp
+                    op_counts[function] += n - mark
+                    mark = n
+                    frames.append(function)
+                    function = owners[a]
+                    call_counts[function] += 1
+                    pc = a
+                elif op == ENTER:
+                    if sp + a >= RAM_SIZE:
+                        raise VMError(f"{function}: stack overflow")
+                    ram[sp:sp + a] = array("h", bytes(2 * a))
+                    sp += a
+                elif op == RETURN:
+                    frame = ram[LCL]
+                    ret = ram[frame - 5] & 0xFFFF
+                    ram[ram[ARG]] = ram[sp - 1]
+                    sp = ram[ARG] + 1
+                    ram[LCL:THAT + 1] = ram[frame - 4:frame]
+                    op_counts[function] += n - mark
+                    mark = n
+                    function = frames.pop() if frames else ""
+                    pc = ret
+                    if pc >= end:
+                        reason = "end"
+                        break
+                elif op == NATIVE:
+                    sp -= b
+                    ram[sp] = natives[a](*ram[sp:sp + b])
+                    sp += 1
+
+                elif op == HALT:
+                    n -= 1
+                    pc -= 1
+                    reason = "halt"
+                    break
+        except IndexError:
+            # a push past the end of RAM
+            if sp < RAM_SIZE:
+                raise
+            raise VMError(f"{function}: stack overflow") from None
+        if sp >= RAM_SIZE:
+            raise VMError(f"{function}: stack overflow")
+
+        op_counts[function] += n - mark
+        self.function = function
+        ram[SP] = sp
+        self.pc, self.ops = pc, n
+        return reason
+
+    def profile(self):
+        # lines of the per-function op and call counts, busiest first
+        total = sum(self.op_counts.values()) or 1
+        lines = [f"{'ops':>12} {'%':>6} {'calls':>9}  function"]
+        for name, count in self.op_counts.most_common():
+            lines.append(f"{count:12} {100 * count / total:6.2f} {self.call_counts[name]:9}  "
+                         f"{name or '(top level)'}")
+        return "\n".join(lines)
+
+
+# -------------------------------------------------
+# Entry
+# -------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run .vm files directly")
+    parser.add_argument("path", help="a .vm file or a directory of .vm files")
+    parser.add_argument("--ops", type=int, default=100_000_000,
+                        help="stop after this many VM commands")
+    parser.add_argument("--ram", nargs=2, type=int, action="append", default=[],
+                        metavar=("ADDR", "VALUE"), help="preset RAM[ADDR] = VALUE")
+    parser.add_argument("--dump", default="0-15", metavar="FROM-TO",
+                        help="RAM range printed at the end")
+    parser.add_argument("--profile", action="store_true",
+                        help="print VM commands executed and calls per function")
+    parser.add_argument("--no-blocks", action="store_true",
+                        help="interpret one command at a time instead of compiling blocks")
+    sys.path.insert(0, NATIVES_DIR)
+    from os_natives import CLASSES as NATIVE_CLASSES, NativeError
+
+    parser.add_argument("--natives", nargs="?", const=",".join(NATIVE_CLASSES), metavar="CLASSES",
+                        help="run OS functions natively (comma-separated classes, default all: "
+                             + ", ".join(NATIVE_CLASSES) + ")")
+    args = parser.parse_args()
+    path = args.path
+    natives = args.natives.split(",") if args.natives else None
+
+    if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith(".vm")]
+    else:
+        files = [path]
+
+    try:
+        vm = VMInterpreter(files, blocks=not args.no_blocks, natives=natives)
+    except VMError as e:
+        sys.exit(f"error: {e}")
+    for address, value in args.ram:
+        vm.ram[address] = value
+
+    start = time.perf_counter()
+    try:
+        reason = vm.run(max_ops=args.ops)
+    except (VMError, NativeError) as e:
+        sys.exit(f"error: {e}")
+    seconds = time.perf_counter() - start
+
+    print(f"stopped ({reason}) after {vm.ops} VM commands "
+          f"in {seconds:.2f}s ({vm.ops / seconds / 1e6:.2f}M commands/s)")
+    lo, hi = map(int, args.dump.split("-"))
+    for address in range(lo, hi + 1):
+        print(f"RAM[{address}] = {vm.ram[address]}")
+    if args.profile:
+        print(vm.profile())
+        if vm.natives:
+            print(vm.natives.report())
@@ -0,0 +1,138 @@
+# Compact, integer-coded form of a VM program
+#
+# All .vm files are parsed once into parallel array columns (one entry per
+# command) plus an interned symbol table, so later passes and the code
+# generator work on small ints instead of re-splitting text lines.
+
+import os
+from array import array
+
+# -------------------------------------------------
+# Opcodes / segments
+# -------------------------------------------------
+(ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+ PUSH, POP, LABEL, GOTO, IF_GOTO, FUNCTION, CALL, RETURN) = range(17)
+
+OPCODES = {
+    "add": ADD, "sub": SUB, "neg": NEG,
+    "eq": EQ, "gt": GT, "lt": LT,
+    "and": AND, "or": OR, "not": NOT,
+    "push": PUSH, "pop": POP,
+    "label": LABEL, "goto": GOTO, "if-goto": IF_GOTO,
+    "function": FUNCTION, "call": CALL, "return": RETURN
+}
+OPCODE_NAMES = list(OPCODES)
+
+SEGMENT_NAMES = ["constant", "local", "argument", "this", "that", "temp", "pointer", "static"]
+SEGMENT_IDS = {name: i for i, name in enumerate(SEGMENT_NAMES)}
+(CONSTANT, LOCAL, ARGUMENT, THIS, THAT, TEMP, POINTER, STATIC) = range(8)
+
+# commands whose argument is a symbol (label or function name)
+SYMBOL_OPS = {LABEL, GOTO, IF_GOTO, FUNCTION, CALL}
+
+
+class VMProgram:
+    def __init__(self):
+        self.ops = array("B")       # opcode
+        self.args = array("H")      # segment id or symbol id
+        self.nums = array("i")      # index / nlocals / nargs
+        self.files = array("H")     # symbol id of the file base name
+        self.lines = array("I")     # line in that file
+        self.symbols = []
+        self.symbol_ids = {}
+
+    def __len__(self):
+        return len(self.ops)
+
+    def intern(self, name):
+        sid = self.symbol_ids.get(name)
+        if sid is None:
+            sid = self.symbol_ids[name] = len(self.symbols)
+            self.symbols.append(name)
+        return sid
+
+    def append(self, op, arg=0, num=0, file=0, line=0):
+        self.ops.append(op)
+        self.args.append(arg)
+        self.nums.append(num)
+        self.files.append(file)
+        self.lines.append(line)
+
+    def slice(self, start, end):
+        # commands start..end as a program of their own (same symbol ids)
+        part = VMProgram()
+        part.ops = self.ops[start:end]
+        part.args = self.args[start:end]
+        part.nums = self.nums[start:end]
+        part.files = self.files[start:end]
+        part.lines = self.lines[start:end]
+        part.symbols = self.symbols
+        part.symbol_ids = self.symbol_ids
+        return part
+
+    def select(self, ranges):
+        # the commands of (start, end) ranges, in order, as one program
+        part = VMProgram()
+        part.symbols = self.symbols
+        part.symbol_ids = self.symbol_ids
+        for start, end in ranges:
+            part.ops += self.ops[start:end]
+            part.args += self.args[start:end]
+            part.nums += self.nums[start:end]
+            part.files += self.files[start:end]
+            part.lines += self.lines[start:end]
+        return part
+
+    def file_ranges(self):
+        # (filebase, start, end) for every run of commands from one file
+        start = 0
+        for i in range(1, len(self.files) + 1):
+            if i == len(self.files) or self.files[i] != self.files[start]:
+                yield self.symbols[self.files[start]], start, i
+                start = i
+
+    def source(self, start, end):
+        # commands start..end as .vm text with their line numbers
+        return "\n".join(f"{self.lines[i]} {self.text(i)}" for i in range(start, end)).encode()
+
+    def text(self, i):
+        op, arg, num = self.ops[i], self.args[i], self.nums[i]
+        name = OPCODE_NAMES[op]
+        if op in (PUSH, POP):
+            return f"{name} {SEGMENT_NAMES[arg]} {num}"
+        if op in (FUNCTION, CALL):
+            return f"{name} {self.symbols[arg]} {num}"
+        if op in SYMBOL_OPS:
+            return f"{name} {self.symbols[arg]}"
+        return name
+
+
+# -------------------------------------------------
+# Parser
+# -------------------------------------------------
+def parse_file(program, path):
+    file = program.intern(os.path.splitext(os.path.basename(path))[0])
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            parts = line.split("//")[0].split()
+            if not parts:
+                continue
+
+            op = OPCODES.get(parts[0])
+            if op is None:
+                continue
+
+            if op in (PUSH, POP):
+                program.append(op, SEGMENT_IDS[parts[1]], int(parts[2]), file, n)
+            elif op in SYMBOL_OPS:
+                num = int(parts[2]) if len(parts) > 2 else 0
+                program.append(op, program.intern(parts[1]), num, file, n)
+            else:
+                program.append(op, 0, 0, file, n)
+
+
+def parse(files):
+    program = VMProgram()
+    for path in files:
+        parse_file(program, path)
+    return program
@@ -1,7 +1,22 @@
-// Coded with the assistance of GPT
+# Coded with the assistance of GPT
 
-import sys
+import argparse
 import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from inline import INLINE_BUDGET, INLINE_SIZE, inline as inline_calls
+from peephole import RULES as PEEPHOLE_RULES, WALK_LIMIT, optimize
+from source_map import SourceMap
+from static_frames import STACK_BASE, assign as assign_frames
+from tree_shake import shake
+from vm_cache import DEFAULT_MAX_BYTES, TranslationCache
+from vm_ir import (
+    OPCODES, OPCODE_NAMES, SEGMENT_NAMES, ARGUMENT,
+    EQ, GT, LT, NOT, PUSH, POP, LABEL, GOTO, IF_GOTO, FUNCTION, CALL, RETURN,
+    parse
+)
 
 ARITHMETIC = {
     "add", "sub", "neg",
@@ -19,15 +34,130 @@ SEGMENTS = {
 TEMP_BASE = 5
 POINTER_BASE = 3  # THIS=3, THAT=4
 
+JUMPS = {
+    "eq": "D;JEQ",
+    "gt": "D;JGT",
+    "lt": "D;JLT"
+}
+NEGATED_JUMPS = {
+    "eq": "D;JNE",
+    "gt": "D;JLE",
+    "lt": "D;JGE"
+}
+COMPARE_OPS = {EQ: "eq", GT: "gt", LT: "lt"}
+
+# Entry points of the shared runtime routines (no '.', so they can never
+# clash with a Jack function name)
+CALL_ROUTINE = "VM$CALL"
+RETURN_ROUTINE = "VM$RETURN"
+HALT_LABEL = "VM$HALT"
+
+# lines buffered before a streaming translator writes them out
+CHUNK_SIZE = 4096
+
+# the Hack assembler lives with Project 6
+ASSEMBLER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Project-06")
+COMPARE_ROUTINES = {
+    "eq": "VM$EQ",
+    "gt": "VM$GT",
+    "lt": "VM$LT"
+}
+
+# OS functions a runtime routine can stand in for (--intrinsics); like the
+# compare routines they take the return address in D instead of a frame
+INTRINSICS = {
+    "Math.multiply": "VM$MULTIPLY",
+    "Math.divide": "VM$DIVIDE"
+}
+
+
+def rom_size(asm):
+    # number of real instructions, i.e. without labels and comments
+    return sum(1 for line in asm if line and line[0] not in "(/")
+
+
+def label_count(asm):
+    return sum(1 for line in asm if line.startswith("("))
+
 
 class VMTranslator:
-    def __init__(self, files):
+    def __init__(self, files, shared_frames=False, compare="inline", peephole=None,
+                 stream=None, chunk_size=CHUNK_SIZE, jobs=1, cache=None, source_map=False,
+                 tree_shake=False, tail_calls=False, fuse_compares=False, cache_top=False,
+                 static_frames=False, frames=None, inline=None, inline_budget=INLINE_BUDGET,
+                 intrinsics=None):
         self.files = files
         self.output = []
+        # labels are numbered per file (File$RET$n), so each file translates
+        # the same on its own as in one run
+        self.label_scope = ""
         self.label_id = 0
         self.current_function = ""
         self.write_bootstrap = len(files) > 1
 
+        # what a worker needs to translate one file the same way
+        self.options = dict(shared_frames=shared_frames, compare=compare, peephole=peephole,
+                            source_map=source_map, tail_calls=tail_calls,
+                            fuse_compares=fuse_compares, cache_top=cache_top,
+                            intrinsics=intrinsics)
+
+        # shared_frames: every call/return jumps to one global routine
+        # instead of inlining the frame save/restore sequence
+        self.shared_frames = shared_frames
+        # compare: "inline" (faster) or "shared" (smaller, one routine
+        # per eq/gt/lt called with a return address)
+        self.compare = compare
+        # tail_calls: `call f n; return` reuses the current frame when f's
+        # arguments fit over the current function's
+        self.tail_calls = tail_calls
+        # fuse_compares: `eq/gt/lt [not] if-goto` becomes one subtraction
+        # and a conditional jump, without a boolean on the stack
+        self.fuse_compares = fuse_compares
+        # cache_top: keep the top of the stack in D between commands and
+        # only write it to RAM before labels, jumps, calls and returns;
+        # top_in_d says whether it is there now
+        self.cache_top = cache_top
+        self.top_in_d = False
+        # intrinsics: names of the INTRINSICS whose `call f 2` jumps to the
+        # runtime routine instead (None = call the OS)
+        self.intrinsics = set(intrinsics or ())
+        # peephole: names of the peephole rules to run over each file's
+        # output (None = off); removed instructions are counted per file
+        self.peephole = peephole
+        self.peephole_stats = {}
+        # stream: open file the output is written to in chunks of about
+        # chunk_size lines (None = keep everything in self.output)
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.lines_written = 0
+        # jobs: files translated in parallel on a process pool
+        self.jobs = jobs
+        # cache: TranslationCache of per-file fragments (None = off)
+        self.cache = cache
+        # source_map: keep the (file, VM line) every output line came from
+        # (None for the bootstrap and runtime) and map ROM addresses to them
+        self.source_map = SourceMap() if source_map else None
+        self.origins = []
+        self.rom_address = 0
+        # tree_shake: only translate the functions Sys.init can reach;
+        # dropped holds (function, instructions saved) for the rest
+        self.tree_shake = tree_shake
+        self.dropped = []
+        # static_frames: give the locals of functions that are never active
+        # twice at once fixed addresses; frames holds {function: (address,
+        # locals)} (a worker gets the frames of its file's functions)
+        self.static_frames = static_frames
+        self.frames = frames
+        self.local_base = None
+        # inline: expand calls to functions of at most this many commands
+        # (None = off) while the program grows by at most inline_budget;
+        # inlined counts the sites per function
+        self.inline = inline
+        self.inline_budget = inline_budget
+        self.inlined = {}
+        self.inline_growth = 0
+        self.runtime = set()
+
         if self.write_bootstrap:
             self.bootstrap()
 
@@ -36,7 +166,7 @@ class VMTranslator:
     # -------------------------------------------------
     def unique_label(self, base):
         self.label_id += 1
-        return f"{base}${self.label_id}"
+        return f"{self.label_scope}${base}${self.label_id}"
 
     def scoped_label(self, label):
         return f"{self.current_function}${label}"
@@ -89,6 +219,9 @@ class VMTranslator:
                 "M=" + ("-M" if cmd == "neg" else "!M")
             ]
 
+        elif cmd in {"eq", "gt", "lt"} and self.compare == "shared":
+            self.write_routine_call(COMPARE_ROUTINES[cmd])
+
         elif cmd in {"eq", "gt", "lt"}:
             self.pop_to_d()
             self.output += ["@SP", "M=M-1", "A=M", "D=M-D"]
@@ -96,14 +229,8 @@ class VMTranslator:
             true_label = self.unique_label("TRUE")
             end_label = self.unique_label("END")
 
-            jump = {
-                "eq": "D;JEQ",
-                "gt": "D;JGT",
-                "lt": "D;JLT"
-            }[cmd]
-
             self.output += [
-                f"@{true_label}", jump,
+                f"@{true_label}", JUMPS[cmd],
                 "@SP", "A=M", "M=0",
                 f"@{end_label}", "0;JMP",
                 f"({true_label})",
@@ -116,7 +243,11 @@ class VMTranslator:
     # Push / Pop
     # -------------------------------------------------
     def write_push(self, segment, index, filebase):
-        if segment == "constant":
+        if segment == "local" and self.local_base is not None:
+            self.output += [f"@{self.local_base + index}", "D=M"]
+            self.push_d()
+
+        elif segment == "constant":
             self.output += [f"@{index}", "D=A"]
             self.push_d()
 
@@ -141,7 +272,11 @@ class VMTranslator:
             self.push_d()
 
     def write_pop(self, segment, index, filebase):
-        if segment in SEGMENTS:
+        if segment == "local" and self.local_base is not None:
+            self.pop_to_d()
+            self.output += [f"@{self.local_base + index}", "M=D"]
+
+        elif segment in SEGMENTS:
             base = SEGMENTS[segment]
             self.output += [
                 f"@{index}", "D=A",
@@ -182,17 +317,42 @@ class VMTranslator:
             "D;JNE"
         ]
 
+    def write_compare_branch(self, cmd, negate, label):
+        # D = x - y, jump on D
+        if not self.top_in_d:
+            self.output += ["@SP", "AM=M-1", "D=M"]
+        self.top_in_d = False
+        self.output += [
+            "@SP", "AM=M-1", "D=M-D",
+            f"@{self.scoped_label(label)}",
+            (NEGATED_JUMPS if negate else JUMPS)[cmd]
+        ]
+
     # -------------------------------------------------
     # Functions
     # -------------------------------------------------
     def write_function(self, name, nlocals):
         self.current_function = name
         self.output.append(f"({name})")
+        frame = self.frames.get(name) if self.frames else None
+        self.local_base = frame[0] if frame else None
+        if frame:
+            for i in range(nlocals):
+                self.output += [f"@{self.local_base + i}", "M=0"]
+            return
+
         for _ in range(nlocals):
             self.output += ["@0", "D=A"]
             self.push_d()
 
     def write_call(self, name, nargs):
+        if name in self.intrinsics and nargs == 2:
+            self.write_routine_call(INTRINSICS[name])
+            return
+        if self.shared_frames:
+            self.write_shared_call(name, nargs)
+            return
+
         ret = self.unique_label("RET")
 
         # push return address
@@ -220,7 +380,28 @@ class VMTranslator:
         # return label
         self.output.append(f"({ret})")
 
+    def write_tail_call(self, name, nargs):
+        # the arguments go down over the current function's, which takes at
+        # least as many; LCL and the saved frame stay, so f returns straight
+        # to our caller
+        self.spill()
+        if nargs:
+            self.output += ["@ARG", "D=M", f"@{nargs}", "D=D+A", "@R13", "M=D"]
+            for _ in range(nargs):
+                self.output += ["@SP", "AM=M-1", "D=M", "@R13", "AM=M-1", "M=D"]
+
+        # SP = LCL, goto function
+        self.output += ["@LCL", "D=M", "@SP", "M=D", f"@{name}", "0;JMP"]
+
     def write_return(self):
+        if self.shared_frames:
+            self.runtime.add(RETURN_ROUTINE)
+            self.output += [f"@{RETURN_ROUTINE}", "0;JMP"]
+            return
+
+        self.write_return_frame()
+
+    def write_return_frame(self):
         # FRAME = LCL
         self.output += ["@LCL", "D=M", "@R13", "M=D"]
 
@@ -248,60 +429,772 @@ class VMTranslator:
         # goto RET
         self.output += ["@R14", "A=M", "0;JMP"]
 
+    # -------------------------------------------------
+    # Shared call / return
+    # -------------------------------------------------
+    def write_shared_call(self, name, nargs):
+        # R13 = target, R14 = nargs, D = return address
+        ret = self.unique_label("RET")
+        self.runtime.add(CALL_ROUTINE)
+
+        self.output += [f"@{name}", "D=A", "@R13", "M=D"]
+        if nargs <= 1:
+            self.output += ["@R14", f"M={nargs}"]
+        else:
+            self.output += [f"@{nargs}", "D=A", "@R14", "M=D"]
+        self.output += [
+            f"@{ret}", "D=A",
+            f"@{CALL_ROUTINE}", "0;JMP",
+            f"({ret})"
+        ]
+
+    def write_routine_call(self, routine):
+        # jump to a runtime routine that returns to the address in D
+        ret = self.unique_label("RET")
+        self.runtime.add(routine)
+        self.output += [
+            f"@{ret}", "D=A",
+            f"@{routine}", "0;JMP",
+            f"({ret})"
+        ]
+
+    def write_call_routine(self):
+        self.output.append(f"({CALL_ROUTINE})")
+
+        # push return address (still in D)
+        self.output += ["@SP", "A=M", "M=D"]
+
+        # save LCL, ARG, THIS, THAT
+        for seg in ["LCL", "ARG", "THIS", "THAT"]:
+            self.output += [f"@{seg}", "D=M", "@SP", "AM=M+1", "M=D"]
+
+        # LCL = SP
+        self.output += ["@SP", "MD=M+1", "@LCL", "M=D"]
+
+        # ARG = SP - 5 - nargs
+        self.output += [
+            "@R14", "D=D-M",
+            "@5", "D=D-A",
+            "@ARG", "M=D"
+        ]
+
+        # goto function
+        self.output += ["@R13", "A=M", "0;JMP"]
+
+    def write_return_routine(self):
+        self.output.append(f"({RETURN_ROUTINE})")
+        self.write_return_frame()
+
+    def write_compare_routine(self, cmd):
+        routine = COMPARE_ROUTINES[cmd]
+        end_label = f"{routine}$END"
+
+        # R15 = return address (passed in D)
+        self.output += [f"({routine})", "@R15", "M=D"]
+
+        # D = x - y, leave x's slot holding true
+        self.output += [
+            "@SP", "AM=M-1", "D=M",
+            "A=A-1", "D=M-D", "M=-1",
+            f"@{end_label}", JUMPS[cmd],
+            "@SP", "A=M-1", "M=0",
+            f"({end_label})"
+        ]
+
+        self.output += ["@R15", "A=M", "0;JMP"]
+
+    # -------------------------------------------------
+    # Intrinsics
+    # -------------------------------------------------
+    def write_multiply_routine(self):
+        # x * y by shift and add, lowest bit of y first, stopping when no
+        # bits are left; R13 = x shifted, R14 = y's bits left, R15 = mask,
+        # x's slot = the sum, y's slot = the return address
+        routine = INTRINSICS["Math.multiply"]
+        loop, shift, end = f"{routine}$LOOP", f"{routine}$SHIFT", f"{routine}$END"
+        self.output += [
+            f"({routine})", "@R13", "M=D",
+            # x * y = -x * -y, so a small negative y ends early too
+            "@SP", "A=M-1", "D=M",
+            f"@{routine}$SETUP", "D;JGE",
+            "M=-M", "A=A-1", "M=-M",
+            f"({routine}$SETUP)",
+            "@SP", "A=M-1", "D=M", "@R14", "M=D",
+            "@R13", "D=M", "@SP", "A=M-1", "M=D",
+            "A=A-1", "D=M", "M=0", "@R13", "M=D",
+            "@R15", "M=1"
+        ]
+        self.output += [
+            f"({loop})",
+            "@R14", "D=M",
+            f"@{end}", "D;JEQ",
+            "@R15", "D=D&M",
+            f"@{shift}", "D;JEQ",
+            # clear the bit, sum += x
+            "@R14", "M=M-D",
+            "@R13", "D=M",
+            "@SP", "A=M-1", "A=A-1", "M=M+D",
+            f"({shift})",
+            "@R13", "D=M", "M=D+M",
+            "@R15", "D=M", "M=D+M",
+            f"@{loop}", "0;JMP"
+        ]
+        self.output += [f"({end})", "@SP", "AM=M-1", "A=M", "0;JMP"]
+
+    def write_divide_routine(self):
+        # x / y rounded towards 0 by restoring division of |x| by |y|: after
+        # x's top bit, R13 = |x| shifted left, R14 = the remainder and R15 =
+        # the quotient, which starts as 1 so that bit 15 set means 15 more
+        # bits are done; y's slot = |y|, x's slot = the return address,
+        # RAM[SP] (above the stack) = -1 for a negative result. y = 0 halts
+        # the machine, like the OS's Sys.error.
+        routine = INTRINSICS["Math.divide"]
+        label = {name: f"{routine}${name.upper()}" for name in
+                 ["y", "x", "first", "loop", "subtract", "end", "result", "return",
+                  "large", "one", "by_zero"]}
+        self.output += [
+            f"({routine})", "@R15", "M=D",
+            "@SP", "A=M", "M=0",
+            "A=A-1", "D=M",
+            f"@{label['by_zero']}", "D;JEQ",
+            f"@{label['y']}", "D;JGT",
+            "@SP", "A=M", "M=!M", "A=A-1", "M=-M",
+            f"({label['y']})",
+            "@SP", "A=M-1", "A=A-1", "D=M", "@R13", "M=D",
+            f"@{label['x']}", "D;JGE",
+            "@SP", "A=M", "M=!M", "@R13", "M=-M",
+            f"({label['x']})",
+            "@R15", "D=M", "@SP", "A=M-1", "A=A-1", "M=D",
+            # |y| = 32768 and |y| = 1 are done apart
+            "@SP", "A=M-1", "D=M",
+            f"@{label['large']}", "D;JLT",
+            "D=D-1",
+            f"@{label['first']}", "D;JNE",
+            "@R13", "D=M",
+            f"@{label['result']}", "0;JMP",
+            # |x|'s top bit: |y| >= 2, so it only goes into the remainder
+            f"({label['first']})",
+            "@R14", "M=0", "@R15", "M=1",
+            "@R13", "D=M",
+            f"@{label['loop']}", "D;JGE",
+            "@R14", "M=1"
+        ]
+        self.output += [
+            f"({label['loop']})",
+            "@R13", "D=M", "M=D+M",
+            "@R15", "D=M",
+            f"@{label['end']}", "D;JLT",
+            "@R15", "M=D+M",
+            # remainder = 2 * remainder + next bit of |x|; it can wrap, but
+            # minus |y| it is back in range
+            "@R14", "D=M", "M=D+M",
+            "@R13", "D=M",
+            f"@{label['subtract']}", "D;JGE",
+            "@R14", "M=M+1",
+            f"({label['subtract']})",
+            "@SP", "A=M-1", "D=M",
+            "@R14", "D=M-D",
+            f"@{label['loop']}", "D;JLT",
+            "@R14", "M=D",
+            "@R15", "M=M+1",
+            f"@{label['loop']}", "0;JMP"
+        ]
+        self.output += [
+            f"({label['end']})",
+            "@32767", "D=A", "@R15", "D=D&M",
+            f"({label['result']})",
+            "@R15", "M=D",
+            "@SP", "A=M", "D=M",
+            f"@{label['return']}", "D;JEQ",
+            "@R15", "M=-M",
+            f"({label['return']})",
+            "@SP", "AM=M-1", "A=A-1", "D=M", "@R14", "M=D",
+            "@R15", "D=M", "@SP", "A=M-1", "M=D",
+            "@R14", "A=M", "0;JMP",
+            # |y| = 32768: 1 for |x| = 32768, else 0
+            f"({label['large']})",
+            "@R13", "D=M",
+            f"@{label['one']}", "D;JLT",
+            "D=0", f"@{label['result']}", "0;JMP",
+            f"({label['one']})",
+            "D=1", f"@{label['result']}", "0;JMP",
+            f"({label['by_zero']})",
+            f"@{label['by_zero']}", "0;JMP"
+        ]
+
+    # -------------------------------------------------
+    # Top of stack in D
+    # -------------------------------------------------
+    def spill(self):
+        if self.top_in_d:
+            self.push_d()
+            self.top_in_d = False
+
+    def spilling(self, write):
+        # handler that gets the stack entirely in RAM
+        def handler(arg, num):
+            self.spill()
+            write(arg, num)
+        return handler
+
+    def load_top(self):
+        # D = the top of the stack, which leaves RAM
+        if not self.top_in_d:
+            self.output += ["@SP", "AM=M-1", "D=M"]
+
+    def write_cached_push(self, segment, index, filebase):
+        self.spill()
+        if segment == "local" and self.local_base is not None:
+            self.output += [f"@{self.local_base + index}", "D=M"]
+        elif segment == "constant":
+            self.output += [f"D={index}"] if index <= 1 else [f"@{index}", "D=A"]
+        elif segment in SEGMENTS:
+            base = SEGMENTS[segment]
+            if index <= 1:
+                self.output += [f"@{base}", "A=M" if index == 0 else "A=M+1", "D=M"]
+            else:
+                self.output += [f"@{index}", "D=A", f"@{base}", "A=M+D", "D=M"]
+        elif segment == "temp":
+            self.output += [f"@{TEMP_BASE + index}", "D=M"]
+        elif segment == "pointer":
+            self.output += [f"@{POINTER_BASE + index}", "D=M"]
+        elif segment == "static":
+            self.output += [f"@{filebase}.{index}", "D=M"]
+        self.top_in_d = True
+
+    def write_cached_pop(self, segment, index, filebase):
+        self.load_top()
+        self.top_in_d = False
+        if segment == "local" and self.local_base is not None:
+            self.output += [f"@{self.local_base + index}", "M=D"]
+        elif segment in SEGMENTS:
+            base = SEGMENTS[segment]
+            if index <= WALK_LIMIT:
+                self.output += [f"@{base}", "A=M"] + ["A=A+1"] * index + ["M=D"]
+            else:
+                self.output += [
+                    "@R13", "M=D",
+                    f"@{index}", "D=A", f"@{base}", "D=M+D", "@R14", "M=D",
+                    "@R13", "D=M", "@R14", "A=M", "M=D"
+                ]
+        elif segment == "temp":
+            self.output += [f"@{TEMP_BASE + index}", "M=D"]
+        elif segment == "pointer":
+            self.output += [f"@{POINTER_BASE + index}", "M=D"]
+        elif segment == "static":
+            self.output += [f"@{filebase}.{index}", "M=D"]
+
+    def write_cached_arithmetic(self, cmd):
+        if cmd in {"neg", "not"}:
+            if self.top_in_d:
+                self.output.append("D=-D" if cmd == "neg" else "D=!D")
+            else:
+                self.write_arithmetic(cmd)
+            return
+
+        if cmd in {"eq", "gt", "lt"} and self.compare == "shared":
+            self.spill()
+            self.write_arithmetic(cmd)
+            return
+
+        # y in D, x popped from RAM, result in D
+        self.load_top()
+        self.top_in_d = True
+        if cmd in {"add", "sub", "and", "or"}:
+            self.output += ["@SP", "AM=M-1",
+                            {"add": "D=M+D", "sub": "D=M-D", "and": "D=M&D", "or": "D=M|D"}[cmd]]
+            return
+
+        true_label = self.unique_label("TRUE")
+        end_label = self.unique_label("END")
+        self.output += [
+            "@SP", "AM=M-1", "D=M-D",
+            f"@{true_label}", JUMPS[cmd],
+            "D=0",
+            f"@{end_label}", "0;JMP",
+            f"({true_label})",
+            "D=-1",
+            f"({end_label})"
+        ]
+
+    def write_cached_if(self, label):
+        if not self.top_in_d:
+            self.write_if(label)
+            return
+        self.top_in_d = False
+        self.output += [f"@{self.scoped_label(label)}", "D;JNE"]
+
+    # -------------------------------------------------
+    # Runtime
+    # -------------------------------------------------
+    def write_runtime(self):
+        if not self.runtime:
+            return
+
+        self.output.append("// runtime")
+        if not self.write_bootstrap:
+            # keep a program without Sys.init from running into the routines
+            self.output += [f"({HALT_LABEL})", f"@{HALT_LABEL}", "0;JMP"]
+
+        if CALL_ROUTINE in self.runtime:
+            self.write_call_routine()
+        if RETURN_ROUTINE in self.runtime:
+            self.write_return_routine()
+        for cmd, routine in COMPARE_ROUTINES.items():
+            if routine in self.runtime:
+                self.write_compare_routine(cmd)
+        if INTRINSICS["Math.multiply"] in self.runtime:
+            self.write_multiply_routine()
+        if INTRINSICS["Math.divide"] in self.runtime:
+            self.write_divide_routine()
+
     # -------------------------------------------------
     # Main
     # -------------------------------------------------
-    def translate(self):
-        for file in self.files:
-            filebase = os.path.splitext(os.path.basename(file))[0]
-            with open(file) as f:
-                for line in f:
-                    line = line.split("//")[0].strip()
-                    if not line:
-                        continue
-
-                    parts = line.split()
-                    cmd = parts[0]
-
-                    if cmd in ARITHMETIC:
-                        self.write_arithmetic(cmd)
-                    elif cmd == "push":
-                        self.write_push(parts[1], int(parts[2]), filebase)
-                    elif cmd == "pop":
-                        self.write_pop(parts[1], int(parts[2]), filebase)
-                    elif cmd == "label":
-                        self.write_label(parts[1])
-                    elif cmd == "goto":
-                        self.write_goto(parts[1])
-                    elif cmd == "if-goto":
-                        self.write_if(parts[1])
-                    elif cmd == "function":
-                        self.write_function(parts[1], int(parts[2]))
-                    elif cmd == "call":
-                        self.write_call(parts[1], int(parts[2]))
-                    elif cmd == "return":
-                        self.write_return()
+    def dispatch_table(self, symbols, filebase):
+        # opcode -> handler(arg, num)
+        table = [None] * len(OPCODE_NAMES)
+        for cmd in ARITHMETIC:
+            table[OPCODES[cmd]] = lambda arg, num, cmd=cmd: self.write_arithmetic(cmd)
+        table[PUSH] = lambda arg, num: self.write_push(SEGMENT_NAMES[arg], num, filebase)
+        table[POP] = lambda arg, num: self.write_pop(SEGMENT_NAMES[arg], num, filebase)
+        table[LABEL] = lambda arg, num: self.write_label(symbols[arg])
+        table[GOTO] = lambda arg, num: self.write_goto(symbols[arg])
+        table[IF_GOTO] = lambda arg, num: self.write_if(symbols[arg])
+        table[FUNCTION] = lambda arg, num: self.write_function(symbols[arg], num)
+        table[CALL] = lambda arg, num: self.write_call(symbols[arg], num)
+        table[RETURN] = lambda arg, num: self.write_return()
+
+        if self.cache_top:
+            for op in (LABEL, GOTO, FUNCTION, CALL, RETURN):
+                table[op] = self.spilling(table[op])
+            for cmd in ARITHMETIC:
+                table[OPCODES[cmd]] = lambda arg, num, cmd=cmd: self.write_cached_arithmetic(cmd)
+            table[PUSH] = lambda arg, num: self.write_cached_push(SEGMENT_NAMES[arg], num, filebase)
+            table[POP] = lambda arg, num: self.write_cached_pop(SEGMENT_NAMES[arg], num, filebase)
+            table[IF_GOTO] = lambda arg, num: self.write_cached_if(symbols[arg])
+        return table
+
+    def generate(self, program):
+        if self.jobs > 1:
+            for fragment in self.translate_files(program):
+                self.add_fragment(*fragment)
+            return
+
+        for filebase, start, end in program.file_ranges():
+            self.generate_file(program, filebase, start, end)
 
+    def generate_file(self, program, filebase, start, end):
+        ops, args, nums, lines = program.ops, program.args, program.nums, program.lines
+        dispatch = self.dispatch_table(program.symbols, filebase)
+        stats = None
+        if self.peephole is not None:
+            stats = self.peephole_stats.setdefault(filebase, Counter())
+
+        # nothing carries over from the previous file
+        self.label_scope = filebase
+        self.label_id = 0
+        self.current_function = ""
+        self.local_base = None
+        self.top_in_d = False
+
+        if self.stream:
+            self.flush()
+        first = len(self.output)
+        if self.source_map is not None:
+            self.pad_origins()
+
+        fused = self.fused_windows(program, start, end)
+        i = start
+        while i < end:
+            window = fused.get(i)
+            if window:
+                count, write = window
+                write()
+            else:
+                count = 1
+                dispatch[ops[i]](args[i], nums[i])
+            if self.source_map is not None:
+                self.origins += [(filebase, lines[i])] * (len(self.output) - len(self.origins))
+            if self.stream and len(self.output) >= self.chunk_size:
+                self.flush(stats, keep_tail=True)
+            i += count
+        self.spill()
+        if self.source_map is not None:
+            self.origins += [(filebase, lines[end - 1])] * (len(self.output) - len(self.origins))
+
+        if self.stream:
+            self.flush(stats)
+        elif stats is not None:
+            origins = self.origins[first:] if self.source_map is not None else None
+            self.output[first:] = optimize(self.output[first:], self.peephole, stats, origins)
+            if self.source_map is not None:
+                self.origins[first:] = origins
+
+    def fused_windows(self, program, start, end):
+        # first index -> (commands, write()) for the command sequences that
+        # are translated as one
+        ops, args, nums, symbols = program.ops, program.args, program.nums, program.symbols
+        fused = {}
+        if self.tail_calls:
+            # (the return after a tail call is never reached)
+            for i in self.find_tail_calls(program, start, end):
+                fused[i] = (2, lambda name=symbols[args[i]], n=nums[i]: self.write_tail_call(name, n))
+        if self.fuse_compares:
+            for i in range(start, end - 1):
+                cmd = COMPARE_OPS.get(ops[i])
+                if cmd is None:
+                    continue
+                negate = ops[i + 1] == NOT
+                j = i + 1 + negate
+                if j < end and ops[j] == IF_GOTO:
+                    fused[i] = (j + 1 - i, lambda cmd=cmd, negate=negate, label=symbols[args[j]]:
+                                self.write_compare_branch(cmd, negate, label))
+        return fused
+
+    def find_tail_calls(self, program, start, end):
+        # indices of the `call f n` directly followed by `return` where the
+        # current function is known to take at least n arguments: it reads
+        # argument n-1, or a call to it in this file passes n or more (and f
+        # is not an intrinsic)
+        ops, args, nums = program.ops, program.args, program.nums
+        nargs = Counter()
+        current = None
+        for i in range(start, end):
+            if ops[i] == FUNCTION:
+                current = args[i]
+            elif ops[i] == CALL:
+                nargs[args[i]] = max(nargs[args[i]], nums[i])
+            elif ops[i] in (PUSH, POP) and args[i] == ARGUMENT and current is not None:
+                nargs[current] = max(nargs[current], nums[i] + 1)
+
+        tail_calls = set()
+        current = None
+        for i in range(start, end - 1):
+            if ops[i] == FUNCTION:
+                current = args[i]
+            elif (ops[i] == CALL and ops[i + 1] == RETURN and current is not None
+                  and nums[i] <= nargs[current]
+                  and program.symbols[args[i]] not in self.intrinsics):
+                tail_calls.add(i)
+        return tail_calls
+
+    def translate_files(self, program):
+        # (filebase, lines, runtime, stats, VM lines) for every file, in file order
+        tasks = [(self.file_options(program, start, end), program.slice(start, end), filebase)
+                 for filebase, start, end in program.file_ranges()]
+        if self.jobs == 1:
+            yield from map(translate_file, tasks)
+            return
+
+        chunksize = max(1, len(tasks) // (4 * self.jobs))
+        with ProcessPoolExecutor(self.jobs) as pool:
+            yield from pool.map(translate_file, tasks, chunksize=chunksize)
+
+    def add_fragment(self, filebase, lines, runtime, stats, vm_lines=None):
+        if self.source_map is not None:
+            self.pad_origins()
+            self.origins += [(filebase, n) if n else None for n in vm_lines]
+        self.output += lines
+        self.runtime |= runtime
+        if stats is not None:
+            self.peephole_stats[filebase] = stats
+        if self.stream:
+            self.flush()
+
+    def generate_cached(self):
+        # only files whose cache entry is missing get parsed and translated;
+        # the whole-program passes need every file parsed, and a file is then
+        # keyed by its commands after them (and its static frames)
+        program = None
+        if self.tree_shake or self.static_frames or self.inline is not None:
+            program = self.analyze(parse(self.files))
+            ranges = {filebase: (start, end) for filebase, start, end in program.file_ranges()}
+
+        keys, fragments, misses = {}, {}, []
+        for path in self.files:
+            filebase = os.path.splitext(os.path.basename(path))[0]
+            if program is None:
+                with open(path, "rb") as f:
+                    keys[filebase] = self.cache.key(filebase, f.read(), self.options)
+            elif filebase in ranges:
+                start, end = ranges[filebase]
+                keys[filebase] = self.cache.key(filebase, program.source(start, end),
+                                                self.file_options(program, start, end))
+            else:
+                continue  # nothing of the file is left
+            cached = self.cache.get(keys[filebase])
+            if cached:
+                fragments[filebase] = (filebase, *cached)
+            else:
+                misses.append(filebase)
+
+        if program is None:
+            program = parse([path for path in self.files
+                             if os.path.splitext(os.path.basename(path))[0] in misses])
+        else:
+            program = program.select([(start, end) for filebase, start, end in program.file_ranges()
+                                      if filebase in misses])
+        for fragment in self.translate_files(program):
+            filebase = fragment[0]
+            self.cache.put(keys[filebase], *fragment[1:])
+            fragments[filebase] = fragment
+
+        for path in self.files:
+            filebase = os.path.splitext(os.path.basename(path))[0]
+            if filebase in fragments:
+                self.add_fragment(*fragments[filebase])
+        self.cache.evict()
+
+    def flush(self, stats=None, keep_tail=False):
+        # Streaming: write out the buffered lines (peephole them first when
+        # stats is given). keep_tail holds back everything from the last
+        # label on, so a peephole window is only split between two chunks
+        # when a whole chunk holds no label.
+        cut = len(self.output)
+        if keep_tail:
+            cut = next((i for i in range(cut - 1, 0, -1) if self.output[i][0] == "("), cut)
+
+        origins = None
+        if self.source_map is not None:
+            self.pad_origins()
+            origins, self.origins = self.origins[:cut], self.origins[cut:]
+        chunk, self.output = self.output[:cut], self.output[cut:]
+        if stats is not None:
+            chunk = optimize(chunk, self.peephole, stats, origins)
+        if origins is not None:
+            self.map_lines(chunk, origins)
+
+        if chunk:
+            if self.lines_written:
+                self.stream.write("\n")
+            self.stream.write("\n".join(chunk))
+            self.lines_written += len(chunk)
+
+    def translate(self):
+        if self.cache:
+            self.generate_cached()
+        else:
+            self.generate(self.analyze(parse(self.files)))
+        self.write_runtime()
+        if self.stream:
+            self.flush()
+        elif self.source_map is not None:
+            self.pad_origins()
+            self.map_lines(self.output, self.origins)
         return self.output
 
+    # -------------------------------------------------
+    # Whole-program passes
+    # -------------------------------------------------
+    def analyze(self, program):
+        if self.inline is not None:
+            program, self.inlined, self.inline_growth = inline_calls(
+                program, self.inline, self.inline_budget)
+        if self.tree_shake:
+            program = self.shake(program)
+        if self.static_frames:
+            self.frames = assign_frames(program)
+        return program
+
+    def file_options(self, program, start, end):
+        # self.options plus the static frames of the functions in start..end
+        if self.frames is None:
+            return self.options
+        names = {program.symbols[program.args[i]] for i in range(start, end)
+                 if program.ops[i] == FUNCTION}
+        return dict(self.options, frames={name: frame for name, frame in self.frames.items()
+                                          if name in names})
+
+    def shake(self, program):
+        # drop the functions Sys.init cannot reach, sizing each in a
+        # translator of its own with the same options
+        kept, dropped = shake(program)
+        options = dict(self.options, source_map=False)
+        for name, start, end in dropped:
+            translator = VMTranslator([], **options)
+            filebase = program.symbols[program.files[start]]
+            translator.generate_file(program.slice(start, end), filebase, 0, end - start)
+            self.dropped.append((name, rom_size(translator.output)))
+        return kept
+
+    # -------------------------------------------------
+    # Source map
+    # -------------------------------------------------
+    def pad_origins(self):
+        # lines emitted outside a file (bootstrap, runtime) have no origin
+        self.origins += [None] * (len(self.output) - len(self.origins))
+
+    def map_lines(self, lines, origins):
+        # record the origins of the instructions among lines, which follow
+        # everything mapped so far
+        smap, address = self.source_map, self.rom_address
+        for line, origin in zip(lines, origins):
+            if line and line[0] not in "(/":
+                if origin:
+                    smap.add(address, origin[0] + ".vm", origin[1])
+                else:
+                    smap.add(address, "", 0)
+                address += 1
+        self.rom_address = address
+
+
+def translate_file(task):
+    # process pool worker: one file of the program in a fresh translator
+    options, program, filebase = task
+    translator = VMTranslator([], **options)
+    translator.generate_file(program, filebase, 0, len(program))
+    vm_lines = [origin[1] if origin else 0 for origin in translator.origins] if options["source_map"] else None
+    return (filebase, translator.output, translator.runtime,
+            translator.peephole_stats.get(filebase), vm_lines)
+
 
 # -------------------------------------------------
 # Entry
 # -------------------------------------------------
 if __name__ == "__main__":
-    path = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Translate .vm files to Hack assembly")
+    parser.add_argument("path", help="a .vm file or a directory of .vm files")
+    parser.add_argument("--shared-frames", action="store_true",
+                        help="use one global call and return routine (smaller ROM)")
+    parser.add_argument("--compare", choices=["inline", "shared"], default="inline",
+                        help="eq/gt/lt inline (faster) or as shared routines (smaller)")
+    parser.add_argument("--peephole", nargs="?", const=",".join(PEEPHOLE_RULES),
+                        metavar="RULES",
+                        help="run the peephole optimizer (comma-separated rules, default all: "
+                             + ", ".join(PEEPHOLE_RULES) + ")")
+    parser.add_argument("--stream", action="store_true",
+                        help="write the .asm in chunks instead of building it in memory")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, metavar="LINES",
+                        help=f"lines buffered per write in --stream mode (default {CHUNK_SIZE})")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N",
+                        help="translate the files on N worker processes")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="translate every file instead of reusing cached fragments")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help="where translated fragments are kept (default: .vmcache next to the input)")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // 2**20, metavar="MB",
+                        help="evict least recently used fragments beyond this size")
+    parser.add_argument("--hack", action="store_true",
+                        help="assemble in memory and write Xxx.hack instead of Xxx.asm")
+    parser.add_argument("--binary", action="store_true",
+                        help="with --hack, also write a packed 16-bit ROM image (Xxx.bin)")
+    parser.add_argument("--report", action="store_true",
+                        help="print the ROM size against a default translation")
+    parser.add_argument("--source-map", action="store_true",
+                        help="also write Xxx.asm.map (ROM address -> .vm file and line)")
+    parser.add_argument("--tail-calls", action="store_true",
+                        help="turn `call f n; return` into a jump that reuses the frame")
+    parser.add_argument("--fuse-compares", action="store_true",
+                        help="translate eq/gt/lt [not] if-goto as one conditional jump")
+    parser.add_argument("--cache-top", action="store_true",
+                        help="keep the top of the stack in D between commands")
+    parser.add_argument("--static-frames", action="store_true",
+                        help="give the locals of non-recursive functions fixed RAM addresses "
+                             "below the stack, after the statics")
+    parser.add_argument("--inline", nargs="?", type=int, const=INLINE_SIZE, metavar="SIZE",
+                        help=f"expand calls to functions of at most SIZE commands (default {INLINE_SIZE})")
+    parser.add_argument("--inline-budget", type=float, default=INLINE_BUDGET, metavar="FRACTION",
+                        help=f"let inlining grow the program by at most this fraction of its "
+                             f"commands (default {INLINE_BUDGET})")
+    parser.add_argument("--intrinsics", nargs="?", const=",".join(INTRINSICS), metavar="FUNCTIONS",
+                        help="replace calls to these OS functions with runtime routines "
+                             "(comma-separated, default all: " + ", ".join(INTRINSICS) + ")")
+    parser.add_argument("--tree-shake", action="store_true",
+                        help="leave out the functions Sys.init can never call")
+    args = parser.parse_args()
+    path = args.path
+
+    if args.hack and args.stream:
+        parser.error("--hack needs the whole program in memory, drop --stream")
+    if args.binary and not args.hack:
+        parser.error("--binary needs --hack")
 
     if os.path.isdir(path):
-        files = [os.path.join(path, f) for f in os.listdir(path) if f.endswith(".vm")]
+        files = [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith(".vm")]
         out = os.path.join(path, os.path.basename(path) + ".asm")
     else:
         files = [path]
         out = path.replace(".vm", ".asm")
 
-    translator = VMTranslator(files)
-    asm = translator.translate()
+    peephole = args.peephole.split(",") if args.peephole else None
+    for rule in peephole or []:
+        if rule not in PEEPHOLE_RULES:
+            parser.error(f"unknown peephole rule: {rule}")
+
+    intrinsics = sorted(args.intrinsics.split(",")) if args.intrinsics else None
+    for name in intrinsics or []:
+        if name not in INTRINSICS:
+            parser.error(f"no intrinsic for {name}")
+
+    cache = None
+    if not args.no_cache:
+        cache_dir = args.cache_dir or os.path.join(os.path.dirname(out), ".vmcache")
+        cache = TranslationCache(cache_dir, args.cache_size * 2**20)
 
-    with open(out, "w") as f:
-        f.write("\n".join(asm))
+    options = dict(shared_frames=args.shared_frames, compare=args.compare, peephole=peephole,
+                   jobs=args.jobs, cache=cache, source_map=args.source_map,
+                   tree_shake=args.tree_shake, tail_calls=args.tail_calls,
+                   fuse_compares=args.fuse_compares, cache_top=args.cache_top,
+                   static_frames=args.static_frames, inline=args.inline,
+                   inline_budget=args.inline_budget, intrinsics=intrinsics)
+
+    if args.stream:
+        with open(out, "w") as f:
+            translator = VMTranslator(files, stream=f, chunk_size=args.chunk_size, **options)
+            translator.translate()
+    else:
+        translator = VMTranslator(files, **options)
+        asm = translator.translate()
+
+    if args.hack:
+        sys.path.insert(0, ASSEMBLER_DIR)
+        from hack_assembler import Assembler, write_hack, write_rom
+
+        assembler = Assembler()
+        words = assembler.assemble(asm)
+        out = os.path.splitext(out)[0] + ".hack"
+        write_hack(out, words)
+        if args.binary:
+            write_rom(os.path.splitext(out)[0] + ".bin", words)
+    elif not args.stream:
+        with open(out, "w") as f:
+            f.write("\n".join(asm))
 
     print(f"✔ Generated {out}")
+    if args.source_map:
+        translator.source_map.write(out + ".map")
+        print(f"✔ Generated {out}.map")
+    if args.inline is not None:
+        print(f"Inlining: {sum(translator.inlined.values())} call sites of "
+              f"{len(translator.inlined)} functions, {translator.inline_growth:+d} VM commands")
+        for name, sites in sorted(translator.inlined.items()):
+            print(f"  {name}: {sites} sites")
+    if args.static_frames:
+        frames = sorted(translator.frames.items(), key=lambda item: item[1])
+        print(f"Static frames: {len(frames)} functions"
+              + (f" in RAM[{frames[0][1][0]}..{STACK_BASE - 1}]" if frames else ""))
+        for name, (address, nlocals) in frames:
+            print(f"  {name}: RAM[{address}..{address + nlocals - 1}]")
+    if args.tree_shake:
+        saved = sum(size for _, size in translator.dropped)
+        print(f"Tree shaking: dropped {len(translator.dropped)} functions, -{saved} instructions")
+        for name, size in translator.dropped:
+            print(f"  {name}: -{size}")
+
+    if args.report:
+        if args.stream:
+            with open(out) as f:
+                asm = f.read().split("\n")
+        baseline = VMTranslator(files).translate()
+        before, after = rom_size(baseline), rom_size(asm)
+        print(f"ROM: {before} -> {after} instructions ({after - before:+d})")
+        before, after = label_count(baseline), label_count(asm)
+        print(f"Labels: {before} -> {after} ({after - before:+d})")
+        if cache:
+            print(f"Cache: {cache.hits} reused, {cache.misses} translated")
+        if args.hack:
+            print(assembler.report(words))
+        for filebase, stats in translator.peephole_stats.items():
+            removed = ", ".join(f"{rule} -{stats[rule]}" for rule in PEEPHOLE_RULES if stats[rule])
+            print(f"  {filebase}: {removed or 'nothing removed'}")
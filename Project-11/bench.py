@@ -0,0 +1,358 @@
+# Benchmarks for the Jack compiler, run on the Hack emulator
+#
+#   python bench.py multiply [DIR]    ROM size and emulated cycles with
+#                                     x * constant inlined or called
+#   python bench.py intrinsics        cycles per Math.multiply/divide call,
+#                                     OS code against vm_translator.py
+#                                     --intrinsics
+#   python bench.py loops [DIR]       VM commands and cycles with while
+#                                     loops tested at the top or bottom
+#
+# The default program moves a ball across the screen like Project 9's
+# Ball.move, drawing it pixel by pixel with the OS's addressing
+# (32 * y + x / 16); it brings its own Math and Screen classes, so it runs
+# without the OS. A DIR of .jack files needs a Sys.vm or Sys.jack whose
+# Sys.init ends in a halt loop.
+
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+COMPILER = os.path.join(HERE, "jackCompiler.py")
+TRANSLATOR = os.path.join(HERE, "..", "Project-08", "vm_translator.py")
+
+# the Hack emulator lives with Project 5, the VM interpreter with Project 8
+EMULATOR_DIR = os.path.join(HERE, "..", "Project-05")
+VM_DIR = os.path.join(HERE, "..", "Project-08")
+
+SCREEN = 16384
+KEYBOARD = 24576
+
+MULTIPLY_CYCLES = ["0", "100", "4000"]
+
+# -------------------------------------------------
+# Programs
+# -------------------------------------------------
+BALL_PROGRAM = {
+    "Main.jack": """
+class Main {
+    function void main() {
+        var int x, y, dx, dy, frame;
+        let x = 250;
+        let y = 120;
+        let dx = 3;
+        let dy = 3;
+        do Math.init();
+        while (frame < FRAMES) {
+            do Screen.setColor(false);
+            do Screen.drawRectangle(x, y, x + 4, y + 4);
+            let x = x + dx;
+            let y = y + dy;
+            if ((x < 3) | (x > 503)) { let dx = -dx; }
+            if ((y < 3) | (y > 247)) { let dy = -dy; }
+            do Screen.setColor(true);
+            do Screen.drawRectangle(x, y, x + 4, y + 4);
+            let frame = frame + 1;
+        }
+        return;
+    }
+}
+""",
+    "Screen.jack": """
+class Screen {
+    static boolean color;
+
+    function void setColor(boolean b) {
+        let color = b;
+        return;
+    }
+
+    function void drawPixel(int x, int y) {
+        var Array screen;
+        var int address, mask;
+        let screen = 16384;
+        let address = (32 * y) + (x / 16);
+        let mask = Math.twoToThe(x & 15);
+        if (color) {
+            let screen[address] = screen[address] | mask;
+        } else {
+            let screen[address] = screen[address] & ~mask;
+        }
+        return;
+    }
+
+    function void drawRectangle(int x1, int y1, int x2, int y2) {
+        var int x, y;
+        let y = y1;
+        while (~(y > y2)) {
+            let x = x1;
+            while (~(x > x2)) {
+                do Screen.drawPixel(x, y);
+                let x = x + 1;
+            }
+            let y = y + 1;
+        }
+        return;
+    }
+}
+""",
+}
+
+# the OS algorithms; twoToThe lives at the bottom of the (unused) heap
+OS_PROGRAM = {
+    "Math.jack": """
+class Math {
+    static Array twoToThe;
+
+    function void init() {
+        var int i, bit;
+        let twoToThe = 2048;
+        let bit = 1;
+        while (i < 16) {
+            let twoToThe[i] = bit;
+            let bit = bit + bit;
+            let i = i + 1;
+        }
+        return;
+    }
+
+    function int twoToThe(int i) {
+        return twoToThe[i];
+    }
+
+    function int multiply(int x, int y) {
+        var int sum, shiftedX, i;
+        let shiftedX = x;
+        while (i < 16) {
+            if (~((y & twoToThe[i]) = 0)) {
+                let sum = sum + shiftedX;
+            }
+            let shiftedX = shiftedX + shiftedX;
+            let i = i + 1;
+        }
+        return sum;
+    }
+
+    function int divide(int x, int y) {
+        if (x < 0) {
+            return -Math.divide(-x, y);
+        }
+        if (y < 0) {
+            return -Math.divide(x, -y);
+        }
+        return Math.quotient(x, y);
+    }
+
+    function int quotient(int x, int y) {
+        var int q;
+        if ((y > x) | (y < 0)) {
+            return 0;
+        }
+        let q = Math.quotient(x, y + y);
+        if ((x - (2 * q * y)) < y) {
+            return q + q;
+        }
+        return q + q + 1;
+    }
+}
+""",
+    "Sys.vm": """function Sys.init 0
+call Main.main 0
+pop temp 0
+label HALT
+goto HALT
+""",
+}
+
+
+# CALLS times OPERATION on operands that change every time (x over the
+# whole range, y odd and below 1024); "x & y" is the baseline
+LOOP_PROGRAM = {
+    "Main.jack": """
+class Main {
+    static int sum;
+
+    function void main() {
+        var int i, x, y;
+        let x = 12345;
+        let y = 3;
+        do Math.init();
+        while (i < CALLS) {
+            let sum = sum + OPERATION;
+            let x = x + 9973;
+            let y = ((y + 38) & 1023) | 1;
+            let i = i + 1;
+        }
+        return;
+    }
+}
+""",
+}
+
+INTRINSIC_OPERATIONS = {"Math.multiply": "Math.multiply(x, y)", "Math.divide": "Math.divide(x, y)"}
+
+
+def write_program(directory, program, **fields):
+    os.makedirs(directory)
+    for name, text in dict(program, **OS_PROGRAM).items():
+        for field, value in fields.items():
+            text = text.replace(field, str(value))
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(text)
+    return directory
+
+
+def run(cmd):
+    if subprocess.run(cmd, stdout=subprocess.DEVNULL).returncode:
+        sys.exit(f"failed: {' '.join(cmd)}")
+
+
+def count_calls(directory, name):
+    count = 0
+    for f in os.listdir(directory):
+        if f.endswith(".vm"):
+            with open(os.path.join(directory, f)) as vm:
+                count += sum(line.split()[:2] == ["call", name] for line in vm)
+    return count
+
+
+# -------------------------------------------------
+# Benchmarks
+# -------------------------------------------------
+def bench_multiply(args):
+    sys.path.insert(0, EMULATOR_DIR)
+    from hack_emulator import HackMachine, load_program
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.abspath(args.path or write_program(os.path.join(tmp, "Ball"), BALL_PROGRAM,
+                                                          FRAMES=args.frames))
+        out = os.path.join(path, os.path.basename(path) + ".asm")
+        print(f"{'calls':>5} {'ROM':>8} {'':>7} {'cycles':>12} {'':>7} {'stop':>6}  "
+              f"screen              multiply cycles")
+
+        base = None
+        for multiply_cycles in args.multiply_cycles:
+            run([sys.executable, COMPILER, path, "--multiply-cycles", multiply_cycles])
+            run([sys.executable, TRANSLATOR, path, "--no-cache"] + args.flags)
+            calls = count_calls(path, "Math.multiply")
+            words, _ = load_program(out)
+            machine = HackMachine(words, blocks=True)
+            reason = machine.run(max_cycles=args.cycles)
+
+            # the screen and the statics
+            ram = machine.ram
+            digest = hashlib.sha1(bytes(ram[SCREEN:KEYBOARD]) + bytes(ram[16:256])).hexdigest()[:12]
+            base = base or (len(words), machine.cycles, digest)
+            same = "same" if digest == base[2] else "DIFFERENT"
+            print(f"{calls:5} {len(words):8} {100 * (len(words) / base[0] - 1):+6.1f}% "
+                  f"{machine.cycles:12} {100 * (machine.cycles / base[1] - 1):+6.1f}% "
+                  f"{reason:>6}  {digest} {same:9}  {multiply_cycles}")
+
+
+def bench_intrinsics(args):
+    sys.path.insert(0, EMULATOR_DIR)
+    from hack_emulator import HackMachine, load_program
+
+    def cycles(tmp, name, operation, flags):
+        # (cycles, Main.sum) of one run of the loop program
+        path = write_program(os.path.join(tmp, name), LOOP_PROGRAM, CALLS=args.calls,
+                             OPERATION=operation)
+        run([sys.executable, COMPILER, path])
+        run([sys.executable, TRANSLATOR, path, "--no-cache"] + flags + args.flags)
+        words, labels = load_program(os.path.join(path, name + ".asm"))
+        machine = HackMachine(words, blocks=True)
+        if machine.run(max_cycles=args.cycles) != "halt":
+            sys.exit(f"{name} did not halt")
+        return machine.cycles, machine.ram[16]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base, _ = cycles(tmp, "Base", "(x & y)", [])
+        print(f"cycles per call over x & y, {args.calls} calls")
+        print(f"{'function':14} {'OS':>8} {'intrinsic':>10} {'saved':>8}  result")
+        for k, (function, operation) in enumerate(INTRINSIC_OPERATIONS.items()):
+            os_cycles, os_sum = cycles(tmp, f"OS{k}", operation, [])
+            intrinsic, sum_ = cycles(tmp, f"Intrinsic{k}", operation, ["--intrinsics", function])
+            os_cycles, intrinsic = (os_cycles - base) / args.calls, (intrinsic - base) / args.calls
+            print(f"{function:14} {os_cycles:8.0f} {intrinsic:10.0f} {os_cycles - intrinsic:8.0f}  "
+                  + ("same" if sum_ == os_sum else "DIFFERENT"))
+
+
+def bench_loops(args):
+    sys.path.insert(0, EMULATOR_DIR)
+    sys.path.insert(0, VM_DIR)
+    from hack_emulator import HackMachine, load_program
+    from vm_interpreter import VMInterpreter
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.abspath(args.path or write_program(os.path.join(tmp, "Ball"), BALL_PROGRAM,
+                                                          FRAMES=args.frames))
+        out = os.path.join(path, os.path.basename(path) + ".asm")
+        print(f"{'VM commands':>12} {'':>7} {'per call':>9} {'cycles':>12} {'':>7} {'stop':>6}  "
+              f"screen              layout")
+
+        base = None
+        for layout, flags in (("test at top", []), ("test at bottom", ["--invert-loops"])):
+            run([sys.executable, COMPILER, path] + flags)
+            vm = VMInterpreter([os.path.join(path, f) for f in sorted(os.listdir(path))
+                                if f.endswith(".vm")])
+            vm.run(max_ops=args.ops)
+            per_call = vm.ops / max(1, vm.call_counts[args.per])
+
+            run([sys.executable, TRANSLATOR, path, "--no-cache"] + args.flags)
+            words, _ = load_program(out)
+            machine = HackMachine(words, blocks=True)
+            reason = machine.run(max_cycles=args.cycles)
+
+            ram = machine.ram
+            digest = hashlib.sha1(bytes(ram[SCREEN:KEYBOARD]) + bytes(ram[16:256])).hexdigest()[:12]
+            base = base or (vm.ops, machine.cycles, digest)
+            same = "same" if digest == base[2] else "DIFFERENT"
+            print(f"{vm.ops:12} {100 * (vm.ops / base[0] - 1):+6.1f}% {per_call:9.1f} "
+                  f"{machine.cycles:12} {100 * (machine.cycles / base[1] - 1):+6.1f}% "
+                  f"{reason:>6}  {digest} {same:9}  {layout}")
+        print(f"(per call of {args.per})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Jack compiler benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("multiply", help="x * constant inlined as adds against Math.multiply calls")
+    p.add_argument("path", nargs="?", help="directory of .jack files (default: the ball program)")
+    p.add_argument("--frames", type=int, default=20, help="frames the ball moves")
+    p.add_argument("--cycles", type=int, default=200_000_000,
+                   help="stop after this many instructions")
+    p.add_argument("--multiply-cycles", nargs="+", default=MULTIPLY_CYCLES, metavar="N",
+                   help="jackCompiler.py --multiply-cycles values to compare (0 = never inline)")
+    p.add_argument("--flags", nargs=argparse.REMAINDER, default=[],
+                   help="extra vm_translator.py options, e.g. --flags --cache-top")
+    p.set_defaults(run=bench_multiply)
+
+    p = sub.add_parser("intrinsics", help="cycles per call of the OS Math functions and intrinsics")
+    p.add_argument("--calls", type=int, default=500)
+    p.add_argument("--cycles", type=int, default=200_000_000,
+                   help="stop after this many instructions")
+    p.add_argument("--flags", nargs=argparse.REMAINDER, default=[],
+                   help="extra vm_translator.py options, e.g. --flags --cache-top")
+    p.set_defaults(run=bench_intrinsics)
+
+    p = sub.add_parser("loops", help="while loops tested at the top against the bottom")
+    p.add_argument("path", nargs="?", help="directory of .jack files (default: the ball program)")
+    p.add_argument("--frames", type=int, default=20, help="frames the ball moves")
+    p.add_argument("--per", default="Screen.drawPixel", metavar="FUNCTION",
+                   help="also show VM commands per call of FUNCTION (default: per pixel, "
+                        "i.e. per iteration of drawRectangle's inner loop)")
+    p.add_argument("--ops", type=int, default=100_000_000,
+                   help="stop the VM interpreter after this many commands")
+    p.add_argument("--cycles", type=int, default=200_000_000,
+                   help="stop the emulator after this many instructions")
+    p.add_argument("--flags", nargs=argparse.REMAINDER, default=[],
+                   help="extra vm_translator.py options, e.g. --flags --fuse-compares")
+    p.set_defaults(run=bench_loops)
+
+    args = parser.parse_args()
+    args.run(args)
@@ -1,4 +1,9 @@
-import sys, os, re
+import argparse, os, re, sys
+from collections import Counter
+
+SOURCE_MAP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Project-08")
+sys.path.insert(0, SOURCE_MAP_DIR)
+from source_map import SourceMap
 
 # -------------------------------------------------
 # Symbol Table
@@ -42,10 +47,27 @@ class SymbolTable:
 # VM Writer
 # -------------------------------------------------
 class VMWriter:
-    def __init__(self, out):
+    def __init__(self, out, smap=None, source=""):
+        # with a SourceMap, every line written is mapped to self.origin,
+        # the (line, column) in the .jack source it was compiled from
         self.out = out
+        self.smap = smap
+        self.source = source
+        self.origin = (0, 0)
+        self.line = 0
+        # while muted, commands are only counted in dropped
+        self.muted = False
+        self.dropped = 0
+
+    def write(self, s):
+        if self.muted:
+            self.dropped += 1
+            return
+        self.line += 1
+        if self.smap is not None:
+            self.smap.add(self.line, self.source, *self.origin)
+        self.out.write(s+"\n")
 
-    def write(self, s): self.out.write(s+"\n")
     def push(self, seg, idx): self.write(f"push {seg} {idx}")
     def pop(self, seg, idx): self.write(f"pop {seg} {idx}")
     def arithmetic(self, cmd): self.write(cmd)
@@ -66,33 +88,155 @@ KEYWORDS = {
 }
 SYMBOLS = set("{}()[].,;+-*/&|<>=~")
 
+BINARY_OPS = {"+":"add","-":"sub","*":None,"/":None,"&":"and","|":"or","<":"lt",">":"gt","=":"eq"}
+OS_OPS = {"*":"Math.multiply","/":"Math.divide"}
+KEYWORD_CONSTANTS = {"true":-1,"false":0,"null":0}
+
+# -------------------------------------------------
+# Constant folding (16-bit two's complement, like the Hack ALU)
+# -------------------------------------------------
+def wrap(v):
+    return (v + 32768 & 0xFFFF) - 32768
+
+def fold_binary(op, x, y):
+    if op=="+": return wrap(x+y)
+    if op=="-": return wrap(x-y)
+    if op=="*": return wrap(x*y)
+    if op=="/":
+        q = abs(x)//abs(y)
+        return wrap(-q if (x<0)!=(y<0) else q)
+    if op=="&": return x&y
+    if op=="|": return x|y
+    # lt/gt test the sign of x - y, which wraps like everything else
+    if op=="<": return -1 if wrap(x-y)<0 else 0
+    if op==">": return -1 if wrap(x-y)>0 else 0
+    return -1 if x==y else 0
+
+def pure(node):
+    # no calls, so evaluating the node can be skipped
+    if node[0]=="call": return False
+    return all(pure(n) for n in node[3:] if isinstance(n, tuple))
+
+def boolean(node):
+    # whether the node's value can only be true (-1) or false (0)
+    if node[0]=="const": return node[2] in (0, -1)
+    if node[0]=="binary" and node[2] in "<>=": return True
+    if node[0]=="binary" and node[2] in "&|": return boolean(node[3]) and boolean(node[4])
+    if node[0]=="unary" and node[2]=="~": return boolean(node[3])
+    return False
+
+def os_calls(node):
+    # Math.multiply/divide calls a node would make
+    n = node[0]=="binary" and node[2] in OS_OPS
+    return n + sum(os_calls(c) for c in node[3:] if isinstance(c, tuple))
+
+def simplify(op, x, y):
+    # identities with one constant side, or None
+    cx = x[2] if x[0]=="const" else None
+    cy = y[2] if y[0]=="const" else None
+    if op in "+|" and cy==0: return x
+    if op in "+|" and cx==0: return y
+    if op=="-" and cy==0: return x
+    if op in "*/" and cy==1: return x
+    if op=="*" and cx==1: return y
+    if op=="&" and cy==-1: return x
+    if op=="&" and cx==-1: return y
+    if op in "*&" and cy==0 and pure(x): return y
+    if op in "*&" and cx==0 and pure(y): return x
+    return None
+
+# -------------------------------------------------
+# Strength reduction of x * constant
+# -------------------------------------------------
+# Horner's rule over the signed binary digits of the constant (non-adjacent
+# form, so 15 is 16 - 1): the product so far is doubled through temp 2 and
+# x, re-read from its variable or saved in temp 1, is added or subtracted
+# for each nonzero digit. The sequence replaces `call Math.multiply 2` when
+# its estimated cycles are below the multiply's (--multiply-cycles).
+MULTIPLY_CYCLES = 4000  # the OS's 16-step loop with call and return (hack_profiler.py)
+
+# Hack instructions per VM command as Project 8 translates them
+PUSH_CYCLES = {"constant":7,"temp":7,"pointer":7,"static":7,"local":10,"argument":10,"this":10}
+COMMAND_CYCLES = {"pop temp":6,"add":10,"sub":10,"neg":3}
+
+def signed_digits(c):
+    # non-adjacent form of c > 0, most significant digit first
+    digits = []
+    while c:
+        d = 2 - c % 4 if c & 1 else 0
+        digits.append(d)
+        c = (c - d) // 2
+    return digits[::-1]
+
+def multiply_commands(x, c):
+    # VM commands taking x (on the stack, and in segment/index x) to x * c,
+    # as ("push"/"pop", segment, index) and (arithmetic command,)
+    commands = []
+    for k, d in enumerate(signed_digits(abs(c))[1:]):
+        if k == 0:
+            commands += [("push",)+x, ("add",)]
+        else:
+            commands += [("pop","temp",2), ("push","temp",2), ("push","temp",2), ("add",)]
+        if d:
+            commands += [("push",)+x, ("add" if d > 0 else "sub",)]
+    if c < 0:
+        commands.append(("neg",))
+    return commands
+
+def command_cycles(commands):
+    return sum(PUSH_CYCLES[cmd[1]] if cmd[0]=="push" else COMMAND_CYCLES[" ".join(cmd[:2])]
+               for cmd in commands)
+
+TOKEN = re.compile(r'//.*|/\*[\s\S]*?\*/|("[^"]*"|\w+|['+re.escape("".join(SYMBOLS))+'])')
+
 class Tokenizer:
     def __init__(self, src):
-        src = re.sub(r"//.*|/\*[\s\S]*?\*/","",src)
-        self.tokens = re.findall(r'"[^"]*"|\w+|['+re.escape("".join(SYMBOLS))+']',src)
+        # tokens with their (line, column), both counted from 1
+        self.tokens, self.positions = [], []
+        line, scanned = 1, 0
+        for m in TOKEN.finditer(src):
+            if m.group(1) is None: continue
+            line += src.count("\n", scanned, m.start())
+            scanned = m.start()
+            self.tokens.append(m.group(1))
+            self.positions.append((line, scanned - src.rfind("\n", 0, scanned)))
         self.i = 0
 
     def peek(self): return self.tokens[self.i]
     def advance(self): self.i += 1; return self.tokens[self.i-1]
     def has(self): return self.i < len(self.tokens)
+    def position(self): return self.positions[self.i-1] if self.i else (1, 1)
 
 # -------------------------------------------------
 # Compilation Engine (FULL)
 # -------------------------------------------------
 class CompilationEngine:
-    def __init__(self, tk, vm):
+    def __init__(self, tk, vm, multiply_cycles=MULTIPLY_CYCLES, invert_loops=False,
+                 eliminate_dead_code=True):
         self.tk = tk
         self.vm = vm
+        self.multiply_cycles = multiply_cycles
+        # invert_loops: test while conditions at the bottom of the loop
+        self.invert_loops = invert_loops
+        # eliminate_dead_code: leave out statements after a return and
+        # branches of constant conditions; reachable says whether the
+        # statement being compiled can run
+        self.eliminate_dead_code = eliminate_dead_code
+        self.reachable = True
         self.st = SymbolTable()
         self.class_name = ""
         self.label_id = 0
+        self.folded = Counter()
         self.compile_class()
 
     def new_label(self, base):
         self.label_id += 1
         return f"{base}{self.label_id}"
 
-    def eat(self): return self.tk.advance()
+    def eat(self):
+        tok = self.tk.advance()
+        self.vm.origin = self.tk.position()
+        return tok
 
     # ---------- class ----------
     def compile_class(self):
@@ -121,9 +265,11 @@ class CompilationEngine:
     # ---------- subroutine ----------
     def compile_subroutine(self):
         self.st.start_subroutine()
+        self.reachable = True
         sub_type = self.eat()
         self.eat()  # return type
         name = self.eat()
+        origin = self.tk.position()
 
         if sub_type == "method":
             self.st.define("this",self.class_name,"arg")
@@ -136,6 +282,7 @@ class CompilationEngine:
         while self.tk.peek()=="var":
             self.compile_var()
 
+        self.vm.origin = origin
         self.vm.function(f"{self.class_name}.{name}",self.st.var_count("var"))
 
         if sub_type=="constructor":
@@ -171,7 +318,17 @@ class CompilationEngine:
     # ---------- statements ----------
     def compile_statements(self):
         while self.tk.peek() in ("let","if","while","do","return"):
-            getattr(self,"compile_"+self.tk.peek())()
+            compile = getattr(self,"compile_"+self.tk.peek())
+            if self.reachable or not self.eliminate_dead_code: compile()
+            else: self.dead(compile)
+
+    def dead(self, compile, *args):
+        # compiles unreachable code: its tokens are consumed, the commands
+        # it would write only counted in vm.dropped
+        muted, reachable = self.vm.muted, self.reachable
+        self.vm.muted = True
+        compile(*args)
+        self.vm.muted, self.reachable = muted, reachable
 
     def compile_let(self):
         self.eat()
@@ -201,13 +358,18 @@ class CompilationEngine:
         self.eat()
         l1,l2 = self.new_label("IF"),self.new_label("ENDIF")
         self.eat()
-        self.compile_expr()
+        cond = self.fold(self.parse_expr())
         self.eat()
+        if self.eliminate_dead_code and cond[0]=="const":
+            self.compile_constant_if(cond)
+            return
+        self.emit(cond)
         self.vm.arithmetic("not")
         self.vm.if_goto(l1)
         self.eat()
         self.compile_statements()
         self.eat()
+        then_reachable, self.reachable = self.reachable, True
         if self.tk.peek()=="else":
             self.vm.goto(l2)
             self.vm.label(l1)
@@ -218,14 +380,44 @@ class CompilationEngine:
             self.vm.label(l2)
         else:
             self.vm.label(l1)
+        self.reachable = self.reachable or then_reachable
+
+    def compile_constant_if(self, cond):
+        # only the branch taken (the then branch for -1, like `not` and
+        # if-goto) is compiled; the condition, not, if-goto, label (and
+        # goto, label with an else) go
+        taken = cond[2]==-1
+        self.dead(self.emit, cond)
+        self.eat()
+        if taken: self.compile_statements()
+        else: self.dead(self.compile_statements)
+        self.eat()
+        if self.tk.peek()=="else":
+            self.eat()
+            self.eat()
+            if taken: self.dead(self.compile_statements)
+            else: self.compile_statements()
+            self.eat()
+            self.vm.dropped += 5
+        else:
+            self.vm.dropped += 3
 
     def compile_while(self):
         self.eat()
-        l1,l2 = self.new_label("WHILE"),self.new_label("ENDWHILE")
-        self.vm.label(l1)
+        origin = self.vm.origin
         self.eat()
-        self.compile_expr()
+        cond = self.fold(self.parse_expr())
         self.eat()
+        if self.eliminate_dead_code and cond[0]=="const":
+            self.compile_constant_while(cond)
+            return
+        if self.invert_loops and boolean(cond):
+            self.compile_inverted_while(cond)
+            return
+        l1,l2 = self.new_label("WHILE"),self.new_label("ENDWHILE")
+        self.vm.origin = origin
+        self.vm.label(l1)
+        self.emit(cond)
         self.vm.arithmetic("not")
         self.vm.if_goto(l2)
         self.eat()
@@ -233,10 +425,46 @@ class CompilationEngine:
         self.eat()
         self.vm.goto(l1)
         self.vm.label(l2)
+        self.reachable = True
+
+    def compile_inverted_while(self, cond):
+        # goto TEST, body, TEST: condition, if-goto back to the body; an
+        # iteration runs one if-goto instead of not, if-goto and goto. The
+        # loop goes on while the condition is -1 (`not` gives 0), so only
+        # a boolean condition can jump back as it is.
+        l1,l2 = self.new_label("WHILE"),self.new_label("WHILETEST")
+        self.vm.goto(l2)
+        self.vm.label(l1)
+        self.eat()
+        self.compile_statements()
+        self.eat()
+        self.vm.label(l2)
+        self.emit(cond)
+        self.vm.if_goto(l1)
+        self.reachable = True
+        self.folded["inverted_loops"] += 1
+
+    def compile_constant_while(self, cond):
+        # while (true) is label, body, goto and only a return leaves it;
+        # any other constant never loops, so the whole loop goes
+        structure = 4 if self.invert_loops and boolean(cond) else 5
+        self.dead(self.emit, cond)
+        self.eat()
+        if cond[2]==-1:
+            l1 = self.new_label("WHILE")
+            self.vm.label(l1)
+            self.compile_statements()
+            self.vm.goto(l1)
+            self.reachable = False
+            self.vm.dropped += structure - 2
+        else:
+            self.dead(self.compile_statements)
+            self.vm.dropped += structure
+        self.eat()
 
     def compile_do(self):
         self.eat()
-        self.compile_call()
+        self.emit(self.fold(self.parse_call()))
         self.vm.pop("temp",0)
         self.eat()
 
@@ -248,89 +476,204 @@ class CompilationEngine:
             self.vm.push("constant",0)
         self.eat()
         self.vm.ret()
+        self.reachable = False
 
     # ---------- expressions ----------
+    # parsed into a tree, folded, then emitted; nodes are tuples
+    # (kind, position, ...):
+    #   ("const", pos, value)          ("var", pos, name)       ("this", pos)
+    #   ("index", pos, name, expr)     ("unary", pos, op, expr)
+    #   ("binary", pos, op, left, right)
+    #   ("call", pos, name, receiver or None, [args])
     def compile_expr(self):
-        self.compile_term()
-        while self.tk.peek() in "+-*/&|<>=":
+        self.emit(self.fold(self.parse_expr()))
+
+    def parse_expr(self):
+        node = self.parse_term()
+        while self.tk.peek() in BINARY_OPS:
             op = self.eat()
-            self.compile_term()
-            self.vm.arithmetic({
-                "+":"add","-":"sub","&":"and","|":"or",
-                "<":"lt",">":"gt","=":"eq"
-            }.get(op, "call Math.multiply 2"))
+            node = ("binary", self.tk.position(), op, node, self.parse_term())
+        return node
 
-    def compile_term(self):
+    def parse_term(self):
         tok = self.tk.peek()
         if tok.isdigit():
-            self.vm.push("constant",int(self.eat()))
-        elif tok=="(":
-            self.eat(); self.compile_expr(); self.eat()
-        elif tok in "-~":
-            op=self.eat(); self.compile_term()
-            self.vm.arithmetic("neg" if op=="-" else "not")
-        else:
-            name = self.eat()
-            if self.tk.peek()=="[":
-                self.push_var(name)
-                self.eat()
-                self.compile_expr()
-                self.eat()
-                self.vm.arithmetic("add")
-                self.vm.pop("pointer",1)
-                self.vm.push("that",0)
-            elif self.tk.peek() in (".","("):
-                self.compile_call(name)
-            else:
-                self.push_var(name)
+            self.eat()
+            return ("const", self.tk.position(), int(tok))
+        if tok in KEYWORD_CONSTANTS:
+            self.eat()
+            return ("const", self.tk.position(), KEYWORD_CONSTANTS[tok])
+        if tok=="this":
+            self.eat()
+            return ("this", self.tk.position())
+        if tok=="(":
+            self.eat(); node = self.parse_expr(); self.eat()
+            return node
+        if tok in ("-","~"):
+            op = self.eat()
+            pos = self.tk.position()
+            return ("unary", pos, op, self.parse_term())
+
+        name = self.eat()
+        pos = self.tk.position()
+        if self.tk.peek()=="[":
+            self.eat(); index = self.parse_expr(); self.eat()
+            return ("index", pos, name, index)
+        if self.tk.peek() in (".","("):
+            return self.parse_call(name)
+        return ("var", pos, name)
 
-    # ---------- helpers ----------
-    def compile_call(self, name=None):
+    def parse_call(self, name=None):
         if name is None:
             name = self.eat()
-        n_args = 0
+        pos = self.tk.position()
+        receiver = None
         if self.tk.peek()==".":
             self.eat()
             sub = self.eat()
-            kind = self.st.kind_of(name)
-            if kind:
-                self.push_var(name)
+            if self.st.kind_of(name):
+                receiver = ("var", pos, name)
                 name = f"{self.st.type_of(name)}.{sub}"
-                n_args = 1
             else:
                 name = f"{name}.{sub}"
         else:
-            self.vm.push("pointer",0)
+            receiver = ("this", pos)
             name = f"{self.class_name}.{name}"
-            n_args = 1
 
         self.eat()
-        if self.tk.peek()!=")":
-            n_args += self.compile_expr_list()
+        args = []
+        while self.tk.peek()!=")":
+            args.append(self.parse_expr())
+            if self.tk.peek()==",": self.eat()
         self.eat()
-        self.vm.call(name,n_args)
-
-    def compile_expr_list(self):
-        c = 0
-        while True:
-            self.compile_expr()
-            c += 1
-            if self.tk.peek() != ",": break
-            self.eat()
-        return c
+        return ("call", pos, name, receiver, args)
+
+    # ---------- folding ----------
+    def fold(self, node):
+        kind, pos = node[0], node[1]
+        if kind=="index":
+            return ("index", pos, node[2], self.fold(node[3]))
+        if kind=="call":
+            return ("call", pos, node[2], node[3], [self.fold(a) for a in node[4]])
+        if kind=="unary":
+            op, x = node[2], self.fold(node[3])
+            if x[0]=="const":
+                self.folded["constants"] += 1
+                return ("const", pos, wrap(-x[2] if op=="-" else ~x[2]))
+            if x[0]=="unary" and x[2]==op:
+                # --x, ~~x
+                self.folded["identities"] += 1
+                return x[3]
+            return ("unary", pos, op, x)
+        if kind!="binary":
+            return node
+
+        op, x, y = node[2], self.fold(node[3]), self.fold(node[4])
+        if x[0]=="const" and y[0]=="const" and not (op=="/" and y[2]==0):
+            self.folded["constants"] += 1
+            self.folded["os_calls"] += op in OS_OPS
+            return ("const", pos, fold_binary(op, x[2], y[2]))
+
+        kept = simplify(op, x, y)
+        if kept is None:
+            return ("binary", pos, op, x, y)
+        self.folded["identities"] += 1
+        self.folded["os_calls"] += (op in OS_OPS) + os_calls(y if kept is x else x)
+        return kept
+
+    # ---------- emitting ----------
+    def emit(self, node):
+        kind = node[0]
+        self.vm.origin = node[1]
+        if kind=="const":
+            v = node[2]
+            if v==-32768:
+                self.vm.push("constant",32767); self.vm.arithmetic("not")
+            elif v<0:
+                self.vm.push("constant",-v); self.vm.arithmetic("neg")
+            else:
+                self.vm.push("constant",v)
+        elif kind=="this":
+            self.vm.push("pointer",0)
+        elif kind=="var":
+            self.push_var(node[2])
+        elif kind=="index":
+            self.push_var(node[2])
+            self.emit(node[3])
+            self.vm.origin = node[1]
+            self.vm.arithmetic("add")
+            self.vm.pop("pointer",1)
+            self.vm.push("that",0)
+        elif kind=="unary":
+            self.emit(node[3])
+            self.vm.origin = node[1]
+            self.vm.arithmetic("neg" if node[2]=="-" else "not")
+        elif kind=="binary":
+            if self.strength_reduce(node):
+                return
+            self.emit(node[3])
+            self.emit(node[4])
+            self.vm.origin = node[1]
+            op = node[2]
+            if op in OS_OPS:
+                self.vm.call(OS_OPS[op],2)
+            else:
+                self.vm.arithmetic(BINARY_OPS[op])
+        elif kind=="call":
+            receiver, args = node[3], node[4]
+            if receiver is not None:
+                self.emit(receiver)
+            for a in args:
+                self.emit(a)
+            self.vm.origin = node[1]
+            self.vm.call(node[2], len(args) + (receiver is not None))
+
+    def strength_reduce(self, node):
+        # emits x * constant as adds when that is cheaper than the call
+        op, x, y = node[2], node[3], node[4]
+        if op!="*" or (x[0]=="const")==(y[0]=="const"):
+            return False
+        if x[0]=="const":
+            x, y = y, x
+        if y[2]==0:
+            # x * 0 with a call in x (simplify drops the pure ones): keep
+            # Math.multiply, which evaluates x and gives 0
+            return False
+
+        if x[0]=="var":
+            saved, place = [], self.location(x[2])
+        elif x[0]=="this":
+            saved, place = [], ("pointer",0)
+        else:
+            saved, place = [("pop","temp",1), ("push","temp",1)], ("temp",1)
+        commands = saved + multiply_commands(place, y[2])
+        if command_cycles(commands) >= self.multiply_cycles:
+            return False
+
+        self.emit(x)
+        self.vm.origin = node[1]
+        for cmd in commands:
+            if cmd[0]=="push": self.vm.push(*cmd[1:])
+            elif cmd[0]=="pop": self.vm.pop(*cmd[1:])
+            else: self.vm.arithmetic(cmd[0])
+        self.folded["strength_reduced"] += 1
+        return True
+
+    def location(self,name):
+        seg = {"static":"static","field":"this","arg":"argument","var":"local"}[self.st.kind_of(name)]
+        return seg, self.st.index_of(name)
 
     def push_var(self,name):
-        seg = {"static":"static","field":"this","arg":"argument","var":"local"}[self.st.kind_of(name)]
-        self.vm.push(seg,self.st.index_of(name))
+        self.vm.push(*self.location(name))
 
     def pop_var(self,name):
-        seg = {"static":"static","field":"this","arg":"argument","var":"local"}[self.st.kind_of(name)]
-        self.vm.pop(seg,self.st.index_of(name))
+        self.vm.pop(*self.location(name))
 
 # -------------------------------------------------
 # Driver
 # -------------------------------------------------
-def compile_path(path):
+def compile_path(path, source_map=False, multiply_cycles=MULTIPLY_CYCLES, invert_loops=False,
+                 eliminate_dead_code=True):
     files=[]
     if os.path.isdir(path):
         files=[os.path.join(path,f) for f in os.listdir(path) if f.endswith(".jack")]
@@ -338,9 +681,38 @@ def compile_path(path):
         files=[path]
 
     for f in files:
+        smap = SourceMap() if source_map else None
         with open(f) as src, open(f.replace(".jack",".vm"),"w") as out:
-            CompilationEngine(Tokenizer(src.read()), VMWriter(out))
-        print(f"✔ Compiled {f}")
+            engine = CompilationEngine(Tokenizer(src.read()), VMWriter(out, smap, os.path.basename(f)),
+                                       multiply_cycles, invert_loops, eliminate_dead_code)
+        folded = engine.folded
+        notes = []
+        if folded["constants"] or folded["identities"]:
+            notes.append(f"folded {folded['constants']} constant, {folded['identities']} "
+                         f"identity expressions; {folded['os_calls']} OS calls eliminated")
+        if folded["strength_reduced"]:
+            notes.append(f"{folded['strength_reduced']} multiplications by constants inlined")
+        if engine.vm.dropped:
+            notes.append(f"{engine.vm.dropped} VM commands of dead code removed")
+        if folded["inverted_loops"]:
+            notes.append(f"{folded['inverted_loops']} loops inverted, 2 VM commands less per iteration")
+        print(f"✔ Compiled {f}" + (f" ({'; '.join(notes)})" if notes else ""))
+        if smap is not None:
+            smap.write(f.replace(".jack",".vm.map"))
+            print(f"✔ Generated {f.replace('.jack','.vm.map')}")
 
 if __name__=="__main__":
-    compile_path(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Jack compiler")
+    parser.add_argument("path", help="Xxx.jack file or directory")
+    parser.add_argument("--source-map", action="store_true",
+                        help="also write Xxx.vm.map (VM line -> .jack line and column)")
+    parser.add_argument("--multiply-cycles", type=int, default=MULTIPLY_CYCLES, metavar="N",
+                        help="estimated cycles of call Math.multiply 2; x * constant is inlined as "
+                             f"adds when cheaper (default {MULTIPLY_CYCLES}, 0 = never)")
+    parser.add_argument("--invert-loops", action="store_true",
+                        help="test while conditions at the bottom, one if-goto per iteration")
+    parser.add_argument("--keep-dead-code", action="store_true",
+                        help="also compile statements after a return and branches of constant conditions")
+    args = parser.parse_args()
+    compile_path(args.path, args.source_map, args.multiply_cycles, args.invert_loops,
+                 not args.keep_dead_code)
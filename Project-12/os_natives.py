@@ -0,0 +1,285 @@
+# Native Python versions of Jack OS functions (Math, Memory, String)
+#
+# The VM interpreter (Project 8) and the Hack emulator (Project 5) can call
+# these in place of the simulated OS routine. A native takes the call's
+# arguments and returns the value the VM function would leave on the stack
+# (0 for void functions); the runner does the call/return bookkeeping, so
+# RAM ends up as after `call F n` returned. Natives replace whole classes:
+# Memory natives keep their own free list, and String natives allocate
+# through it, so String needs Memory.
+
+from array import array
+from collections import Counter
+
+HEAP_BASE = 2048
+HEAP_END = 16384  # the screen starts here
+
+CLASSES = ["Math", "Memory", "String"]
+REQUIRES = {"String": "Memory"}
+
+# "Class.function" -> (number of arguments, function(os, *args) -> value)
+NATIVES = {}
+
+
+class NativeError(Exception):
+    pass
+
+
+def native(name, nargs):
+    def register(fn):
+        NATIVES[name] = (nargs, fn)
+        return fn
+    return register
+
+
+def wrap(value):
+    # 16-bit two's complement, like the Hack ALU
+    return (value + 32768 & 0xFFFF) - 32768
+
+
+# -------------------------------------------------
+# Math
+# -------------------------------------------------
+@native("Math.init", 0)
+def math_init(os):
+    return 0
+
+
+@native("Math.multiply", 2)
+def math_multiply(os, x, y):
+    return wrap(x * y)
+
+
+@native("Math.divide", 2)
+def math_divide(os, x, y):
+    if y == 0:
+        raise NativeError("Math.divide: division by zero")
+    q = abs(x) // abs(y)
+    return wrap(-q if (x < 0) != (y < 0) else q)
+
+
+@native("Math.min", 2)
+def math_min(os, x, y):
+    return min(x, y)
+
+
+@native("Math.max", 2)
+def math_max(os, x, y):
+    return max(x, y)
+
+
+@native("Math.abs", 1)
+def math_abs(os, x):
+    return wrap(abs(x))
+
+
+@native("Math.sqrt", 1)
+def math_sqrt(os, x):
+    if x < 0:
+        raise NativeError("Math.sqrt: negative argument")
+    r = int(x ** 0.5)
+    while r * r > x:
+        r -= 1
+    while (r + 1) * (r + 1) <= x:
+        r += 1
+    return r
+
+
+# -------------------------------------------------
+# Memory
+# -------------------------------------------------
+@native("Memory.init", 0)
+def memory_init(os):
+    os.free = [(HEAP_BASE, HEAP_END - HEAP_BASE)]
+    os.sizes = {}
+    return 0
+
+
+@native("Memory.peek", 1)
+def memory_peek(os, address):
+    return os.ram[address & 0x7FFF]
+
+
+@native("Memory.poke", 2)
+def memory_poke(os, address, value):
+    os.ram[address & 0x7FFF] = value
+    return 0
+
+
+@native("Memory.alloc", 1)
+def memory_alloc(os, size):
+    # first fit; blocks are zeroed like a freshly booted heap
+    if size <= 0:
+        raise NativeError(f"Memory.alloc: bad size {size}")
+    for i, (base, length) in enumerate(os.free):
+        if length >= size:
+            if length == size:
+                del os.free[i]
+            else:
+                os.free[i] = (base + size, length - size)
+            os.sizes[base] = size
+            os.ram[base:base + size] = array("h", bytes(2 * size))
+            return base
+    raise NativeError(f"Memory.alloc: heap overflow ({size} words)")
+
+
+@native("Memory.deAlloc", 1)
+def memory_dealloc(os, address):
+    size = os.sizes.pop(address, None)
+    if size is None:
+        raise NativeError(f"Memory.deAlloc: {address} was not allocated")
+
+    # keep the free list sorted and merge neighbours
+    free = os.free
+    i = 0
+    while i < len(free) and free[i][0] < address:
+        i += 1
+    free.insert(i, (address, size))
+    if i + 1 < len(free) and address + size == free[i + 1][0]:
+        free[i] = (address, size + free.pop(i + 1)[1])
+    if i and free[i - 1][0] + free[i - 1][1] == address:
+        free[i - 1] = (free[i - 1][0], free[i - 1][1] + free.pop(i)[1])
+    return 0
+
+
+# -------------------------------------------------
+# String: [chars, length, max length], chars a heap block of max length
+# -------------------------------------------------
+CHARS, LENGTH, MAX_LENGTH = range(3)
+
+
+@native("String.new", 1)
+def string_new(os, max_length):
+    if max_length < 0:
+        raise NativeError(f"String.new: bad length {max_length}")
+    this = memory_alloc(os, 3)
+    os.ram[this + CHARS] = memory_alloc(os, max(max_length, 1))
+    os.ram[this + MAX_LENGTH] = max_length
+    return this
+
+
+@native("String.dispose", 1)
+def string_dispose(os, this):
+    memory_dealloc(os, os.ram[this + CHARS])
+    return memory_dealloc(os, this)
+
+
+@native("String.length", 1)
+def string_length(os, this):
+    return os.ram[this + LENGTH]
+
+
+@native("String.charAt", 2)
+def string_char_at(os, this, j):
+    if not 0 <= j < os.ram[this + LENGTH]:
+        raise NativeError(f"String.charAt: index {j} out of range")
+    return os.ram[os.ram[this + CHARS] + j]
+
+
+@native("String.setCharAt", 3)
+def string_set_char_at(os, this, j, c):
+    if not 0 <= j < os.ram[this + LENGTH]:
+        raise NativeError(f"String.setCharAt: index {j} out of range")
+    os.ram[os.ram[this + CHARS] + j] = c
+    return 0
+
+
+@native("String.appendChar", 2)
+def string_append_char(os, this, c):
+    ram = os.ram
+    length = ram[this + LENGTH]
+    if length >= ram[this + MAX_LENGTH]:
+        raise NativeError("String.appendChar: string is full")
+    ram[ram[this + CHARS] + length] = c
+    ram[this + LENGTH] = length + 1
+    return this
+
+
+@native("String.eraseLastChar", 1)
+def string_erase_last_char(os, this):
+    if os.ram[this + LENGTH]:
+        os.ram[this + LENGTH] -= 1
+    return 0
+
+
+@native("String.intValue", 1)
+def string_int_value(os, this):
+    ram = os.ram
+    chars, length = ram[this + CHARS], ram[this + LENGTH]
+    value, sign = 0, 1
+    for j in range(length):
+        c = ram[chars + j]
+        if j == 0 and c == ord("-"):
+            sign = -1
+        elif ord("0") <= c <= ord("9"):
+            value = value * 10 + c - ord("0")
+        else:
+            break
+    return wrap(sign * value)
+
+
+@native("String.setInt", 2)
+def string_set_int(os, this, value):
+    ram = os.ram
+    digits = str(value)
+    if len(digits) > ram[this + MAX_LENGTH]:
+        raise NativeError("String.setInt: string is too short")
+    chars = ram[this + CHARS]
+    for j, c in enumerate(digits):
+        ram[chars + j] = ord(c)
+    ram[this + LENGTH] = len(digits)
+    return 0
+
+
+@native("String.newLine", 0)
+def string_new_line(os):
+    return 128
+
+
+@native("String.backSpace", 0)
+def string_back_space(os):
+    return 129
+
+
+@native("String.doubleQuote", 0)
+def string_double_quote(os):
+    return 34
+
+
+# -------------------------------------------------
+# Runner interface
+# -------------------------------------------------
+class NativeOS:
+    def __init__(self, ram, classes=None):
+        self.ram = ram
+        self.classes = set(CLASSES if classes is None else classes)
+        for cls in self.classes:
+            if cls not in CLASSES:
+                raise NativeError(f"no natives for class {cls}")
+            needed = REQUIRES.get(cls)
+            if needed and needed not in self.classes:
+                raise NativeError(f"{cls} natives need {needed} natives")
+        self.calls = Counter()
+        memory_init(self)
+
+    def functions(self):
+        # names of the enabled natives
+        return [name for name in NATIVES if name.split(".")[0] in self.classes]
+
+    def hook(self, name):
+        # (nargs, call(*args) -> value) for an enabled native, else None
+        if name not in NATIVES or name.split(".")[0] not in self.classes:
+            return None
+        nargs, fn = NATIVES[name]
+        calls = self.calls
+
+        def call(*args):
+            calls[name] += 1
+            return wrap(fn(self, *args))
+        return nargs, call
+
+    def report(self):
+        lines = [f"{'calls':>9}  native"]
+        for name, count in self.calls.most_common():
+            lines.append(f"{count:9}  {name}")
+        return "\n".join(lines)
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ASSEMBLER_DIR = os.path.join(HERE, "..", "Project-06")
+sys.path.insert(0, ASSEMBLER_DIR)
+
+from hack_assembler import Assembler
+
+
+def test_symbols():
+    words = Assembler().assemble(["(Main.main$RET:1)", "@Main.main$RET:1", "@_x.y$z", "@12", "0;JMP"])
+    assert list(words) == [0, 16, 12, 0b1110101010000111]
+
+
+@pytest.mark.parametrize("line, error", [
+    ("(LOOP", "line 1: bad label (LOOP"),
+    ("()", "line 1: bad label ()"),
+    ("(1LOOP)", "line 1: bad label (1LOOP)"),
+    ("@-1", "line 1: bad symbol @-1"),
+    ("@1a", "line 1: bad symbol @1a"),
+    ("@a-b", "line 1: bad symbol @a-b"),
+])
+def test_bad_symbols(line, error):
+    with pytest.raises(ValueError) as e:
+        Assembler().assemble([line, "0;JMP"])
+    assert str(e.value) == error
@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EMULATOR_DIR = os.path.join(HERE, "..", "Project-05")
+TRANSLATOR = os.path.join(HERE, "..", "Project-08", "vm_translator.py")
+sys.path.insert(0, EMULATOR_DIR)
+
+from hack_emulator import HackMachine, load_program
+
+
+def translate(tmp_path, files, *flags):
+    # Xxx.vm sources -> (ROM words, labels) of the translated directory
+    for name, source in files.items():
+        (tmp_path / name).write_text(source)
+    subprocess.run([sys.executable, TRANSLATOR, str(tmp_path), "--no-cache", *flags],
+                   check=True, capture_output=True)
+    return load_program(str(tmp_path / (tmp_path.name + ".asm")))
+
+
+def test_native_without_arguments(tmp_path):
+    # ARG == LCL-5 here, where the call's return address is saved
+    words, labels = translate(tmp_path, {
+        "Sys.vm": """
+function Sys.init 0
+call String.newLine 0
+call String.doubleQuote 0
+add
+pop static 0
+label HALT
+goto HALT
+""",
+        "String.vm": """
+function String.newLine 0
+push constant 0
+return
+function String.doubleQuote 0
+push constant 0
+return
+"""})
+    for blocks in (False, True):
+        machine = HackMachine(words, blocks=blocks)
+        machine.install_natives(labels, ["Memory", "String"])
+        assert machine.run(max_cycles=10000) == "halt"
+        assert machine.ram[16] == 128 + 34
@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EMULATOR_DIR = os.path.join(HERE, "..", "Project-05")
+TRANSLATOR = os.path.join(HERE, "..", "Project-08", "vm_translator.py")
+sys.path.insert(0, EMULATOR_DIR)
+
+from hack_emulator import HackMachine, load_program
+from hack_profiler import ProgramMap, profile_exact
+
+SUM_PROGRAM = {
+    "Sys.vm": """
+function Sys.init 0
+push constant 100
+push constant 0
+call Main.sum 2
+push constant 50
+push constant 0
+call Main.sum 2
+add
+pop static 0
+label HALT
+goto HALT
+""",
+    # sum(n, acc): acc + n + ... + 1, as a tail call
+    "Main.vm": """
+function Main.sum 0
+push argument 0
+push constant 0
+eq
+if-goto DONE
+push argument 0
+push constant 1
+sub
+push argument 1
+push argument 0
+add
+call Main.sum 2
+return
+label DONE
+push argument 1
+return
+"""}
+
+
+def profile(path, *flags):
+    path.mkdir()
+    for name, source in SUM_PROGRAM.items():
+        (path / name).write_text(source)
+    subprocess.run([sys.executable, TRANSLATOR, str(path), "--no-cache", *flags],
+                   check=True, capture_output=True)
+    words, labels = load_program(str(path / (path.name + ".asm")))
+    machine = HackMachine(words)
+    prof, reason = profile_exact(machine, ProgramMap(machine.rom, labels), 1_000_000)
+    assert reason == "halt"
+    assert machine.ram[16] == 5050 + 1275
+    return prof
+
+
+def test_tail_calls(tmp_path):
+    plain = profile(tmp_path / "plain")
+    tail = profile(tmp_path / "tail", "--tail-calls")
+    for prof in (plain, tail):
+        assert prof.calls["Main.sum"] == 152
+        assert prof.edges["Sys.init", "Main.sum"][0] == 2
+        assert prof.edges["Main.sum", "Main.sum"][0] == 150
+        assert sum(prof.exclusive.values()) == sum(prof.stacks.values())
+    # each tail call ends its caller's frame, so the stacks stay flat and
+    # Sys.init only pays for its own code
+    assert set(tail.stacks) <= {"(bootstrap)", "(bootstrap);Sys.init",
+                                "(bootstrap);Sys.init;Main.sum"}
+    assert tail.exclusive["Sys.init"] < plain.exclusive["Sys.init"] + 10
+    assert tail.inclusive["Main.sum"] > sum(tail.exclusive.values()) * 0.9
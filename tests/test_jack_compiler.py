@@ -0,0 +1,78 @@
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+COMPILER_DIR = os.path.join(HERE, "..", "Project-11")
+VM_DIR = os.path.join(HERE, "..", "Project-08")
+sys.path.insert(0, COMPILER_DIR)
+sys.path.insert(0, VM_DIR)
+
+from jackCompiler import compile_path
+from vm_interpreter import VMInterpreter
+
+SYS = """
+class Sys {
+    function void init() {
+        do Main.main();
+        while (true) {}
+        return;
+    }
+}
+"""
+
+RESULTS = 3000
+
+
+def run_main(tmp_path, body, extra=""):
+    # compiles Main.main with body, which stores into res[...] (RAM[3000...])
+    (tmp_path / "Sys.jack").write_text(SYS)
+    (tmp_path / "Main.jack").write_text("""
+class Main {
+    static int calls;
+    function void main() {
+        var Array res;
+        var int a, b;
+        let res = %d;
+        %s
+        return;
+    }
+    %s
+}
+""" % (RESULTS, body, extra))
+    compile_path(str(tmp_path))
+    files = [str(tmp_path / f) for f in ("Sys.vm", "Main.vm")]
+    vm = VMInterpreter(files, natives=["Math"])
+    assert vm.run(max_ops=100000) == "halt"
+    return vm.ram
+
+
+SEVEN = """
+    function int seven() {
+        let calls = calls + 1;
+        return 7;
+    }
+"""
+
+
+def test_impure_times_zero(tmp_path):
+    ram = run_main(tmp_path, """
+        let res[0] = Main.seven() * 0;
+        let res[1] = 0 * Main.seven();
+        let res[2] = calls;
+    """, SEVEN)
+    assert list(ram[RESULTS:RESULTS + 3]) == [0, 0, 2]
+
+
+def test_folded_compares_wrap(tmp_path):
+    # x - y overflows, and lt/gt test its sign
+    ram = run_main(tmp_path, """
+        let a = -20000;
+        let b = 20000;
+        let res[0] = (-20000) < 20000;
+        let res[1] = a < b;
+        let res[2] = 20000 > (-20000);
+        let res[3] = b > a;
+        let res[4] = (-2) < 3;
+        let res[5] = 3 > (-2);
+    """)
+    assert list(ram[RESULTS:RESULTS + 6]) == [0, 0, 0, 0, -1, -1]
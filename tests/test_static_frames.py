@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EMULATOR_DIR = os.path.join(HERE, "..", "Project-05")
+TRANSLATOR = os.path.join(HERE, "..", "Project-08", "vm_translator.py")
+sys.path.insert(0, EMULATOR_DIR)
+
+from hack_emulator import HackMachine, load_program
+
+# Main.keep has a static frame and calls a recursion deep enough to take
+# the stack past RAM[2047]
+PROGRAM = {
+    "Sys.vm": """
+function Sys.init 0
+call Main.keep 0
+pop static 0
+label HALT
+goto HALT
+""",
+    "Main.vm": """
+function Main.keep 2
+push constant 1234
+pop local 0
+push constant 5678
+pop local 1
+push constant 300
+call Main.deep 1
+pop temp 0
+push local 0
+push local 1
+add
+return
+function Main.deep 0
+push argument 0
+push constant 0
+eq
+if-goto END
+push argument 0
+push constant 1
+sub
+call Main.deep 1
+return
+label END
+push constant 0
+return
+"""}
+
+
+def test_deep_stack_keeps_static_frames(tmp_path):
+    for name, source in PROGRAM.items():
+        (tmp_path / name).write_text(source)
+    result = subprocess.run([sys.executable, TRANSLATOR, str(tmp_path), "--no-cache",
+                             "--static-frames"], check=True, capture_output=True, text=True)
+    assert "Main.keep: RAM[254..255]" in result.stdout
+    words, _ = load_program(str(tmp_path / (tmp_path.name + ".asm")))
+    machine = HackMachine(words)
+    assert machine.run(max_cycles=1_000_000) == "halt"
+    assert machine.ram[16] == 1234 + 5678
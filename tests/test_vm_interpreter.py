@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+VM_DIR = os.path.join(HERE, "..", "Project-08")
+INTERPRETER = os.path.join(VM_DIR, "vm_interpreter.py")
+sys.path.insert(0, VM_DIR)
+
+from vm_interpreter import VMError, VMInterpreter
+
+RUNAWAY = """
+function Sys.init 0
+push constant 1
+call Sys.f 1
+label H
+goto H
+function Sys.f 0
+push argument 0
+call Sys.f 1
+return
+"""
+
+# pushes until the stack runs off the end of RAM
+PUSHES = """
+function Sys.init 0
+label LOOP
+push constant 1
+goto LOOP
+"""
+
+
+@pytest.mark.parametrize("source", [RUNAWAY, PUSHES])
+@pytest.mark.parametrize("blocks, natives", [(True, None), (False, None), (True, ["Math"])])
+def test_stack_overflow(tmp_path, source, blocks, natives):
+    path = tmp_path / "Sys.vm"
+    path.write_text(source)
+    vm = VMInterpreter([str(path)], blocks=blocks, natives=natives)
+    name = "Sys.f" if source is RUNAWAY else "Sys.init"
+    with pytest.raises(VMError, match=f"{name}: stack overflow"):
+        vm.run(max_ops=1_000_000)
+
+
+def test_stack_overflow_message(tmp_path):
+    path = tmp_path / "Sys.vm"
+    path.write_text(RUNAWAY)
+    result = subprocess.run([sys.executable, INTERPRETER, str(path)], capture_output=True, text=True)
+    assert result.returncode == 1
+    assert result.stderr.strip() == "error: Sys.f: stack overflow"